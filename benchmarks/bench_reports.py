@@ -0,0 +1,65 @@
+#!/usr/env python3
+
+import pytest
+
+from reports import dbchangelog
+from reports import pullrequests as prsreport
+
+SIZES = [10, 100, 1000]
+
+
+def __cell_count(report):
+    return sum(len(env_report.cells) for env_report in report.envs.values())
+
+
+@pytest.mark.parametrize('services', SIZES)
+def test_versions_report_warm(benchmark, services_factory, services):
+    services_data = services_factory(services)
+    report = benchmark.pedantic(prsreport.create_report, args=(services_data,), rounds=5, warmup_rounds=1)
+    assert __cell_count(report) == 2 * services
+
+
+@pytest.mark.parametrize('services', SIZES)
+def test_versions_report_cold(benchmark, services_factory, services):
+    def setup():
+        return (services_factory(services, cold=True),), {}
+
+    report = benchmark.pedantic(prsreport.create_report, setup=setup, rounds=3)
+    assert __cell_count(report) == 2 * services
+
+
+@pytest.mark.parametrize('services', SIZES)
+def test_versions_report_render(benchmark, services_factory, services):
+    services_data = services_factory(services)
+    report = prsreport.create_report(services_data)
+
+    def render():
+        return ''.join(prsreport.render_report(report, services_data))
+
+    assert benchmark(render)
+
+
+@pytest.mark.parametrize('services', SIZES)
+def test_migrations_report_warm(benchmark, services_factory, services):
+    services_data = services_factory(services)
+    report = benchmark.pedantic(dbchangelog.create_report, args=('release-1.0.0', services_data),
+                                rounds=5, warmup_rounds=1)
+    assert len(report.apps) == services
+
+
+@pytest.mark.parametrize('services', SIZES)
+def test_migrations_report_cold(benchmark, services_factory, services):
+    def setup():
+        return ('release-1.0.0', services_factory(services, cold=True)), {}
+
+    report = benchmark.pedantic(dbchangelog.create_report, setup=setup, rounds=3)
+    assert len(report.apps) == services
+
+
+@pytest.mark.parametrize('services', SIZES)
+def test_migrations_matrix_cold(benchmark, services_factory, services):
+    def setup():
+        return (['release-1.0.0', 'release-1.1.0', 'release-1.2.0'], services_factory(services, cold=True)), {}
+
+    report = benchmark.pedantic(dbchangelog.create_matrix_report, setup=setup, rounds=3)
+    assert len(report.apps) == services
@@ -0,0 +1,53 @@
+#!/usr/env python3
+
+import itertools
+import os
+import sys
+
+import pytest
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), 'tracker'))
+
+from fake_upstream import FakeUpstream, Settings, write_services_file  # noqa: E402
+
+__upstream = None
+__cold_runs = itertools.count(1)
+
+
+def pytest_configure(config):
+    global __upstream
+    # the tracker reads the Bitbucket URL and credentials on import, so the fake must be up before that
+    __upstream = FakeUpstream(Settings(status_latency=float(os.environ.get('BENCH_STATUS_LATENCY', 0.005)),
+                                       status_error_rate=float(os.environ.get('BENCH_STATUS_ERROR_RATE', 0.01)),
+                                       bitbucket_latency=float(os.environ.get('BENCH_BITBUCKET_LATENCY', 0.01)),
+                                       bitbucket_error_rate=float(os.environ.get('BENCH_BITBUCKET_ERROR_RATE', 0))))
+    __upstream.start()
+    os.environ['BITBUCKET_API_URL'] = __upstream.api_url
+    os.environ.setdefault('BITBUCKET_USER', 'benchmark')
+    os.environ.setdefault('BITBUCKET_API_KEY', 'benchmark')
+    os.environ.setdefault('BITBUCKET_CACHE_BACKEND', 'memory')
+    os.environ.setdefault('TRACKER_LOG_LEVEL', 'WARNING')
+
+
+def pytest_unconfigure(config):
+    if __upstream is not None:
+        __upstream.stop()
+
+
+@pytest.fixture(scope='session')
+def upstream():
+    return __upstream
+
+
+@pytest.fixture
+def services_factory(upstream, tmp_path_factory):
+    from reports.config import ServicesData
+
+    def create(count, cold=False):
+        # fresh repo names miss every index and cache, which is what a restarted tracker sees
+        suffix = '-cold{}'.format(next(__cold_runs)) if cold else ''
+        path = tmp_path_factory.mktemp('services') / 'services.json'
+        return ServicesData(str(write_services_file(path, count, upstream.url, suffix)))
+
+    return create
@@ -0,0 +1,269 @@
+#!/usr/env python3
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from flask import Flask, Response, abort, jsonify, request
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format="%(asctime)s %(levelname)-8s [%(funcName)15s()] %(message)s")
+logger.setLevel(logging.INFO)
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+API_PREFIX = '/2.0'
+DEV_BRANCH = 'devel'
+RELEASE_BRANCH = 'release-1.0.0'
+EPOCH = datetime(2020, 1, 1)
+
+__branch_tag_prefix = {DEV_BRANCH: ('dev-', 'dev-0.0.{}'), RELEASE_BRANCH: ('release-', 'release-1.0.{}')}
+__destination_regex = re.compile(r'destination\.branch\.name="([^"]+)"')
+__updated_on_regex = re.compile(r'updated_on > (\S+)')
+__name_regex = re.compile(r'name~"([^"]+)"')
+
+
+class Settings:
+    def __init__(self, status_latency=0.005, status_error_rate=0.01, bitbucket_latency=0.01,
+                 bitbucket_error_rate=0.0, pull_requests=200, migrations=300, seed=0):
+        self.status_latency = status_latency
+        self.status_error_rate = status_error_rate
+        self.bitbucket_latency = bitbucket_latency
+        self.bitbucket_error_rate = bitbucket_error_rate
+        self.pull_requests = pull_requests
+        self.migrations = migrations
+        self.seed = seed
+
+
+def commit_hash(app_name, branch, number):
+    return hashlib.sha1('{}:{}:{}'.format(app_name, branch, number).encode()).hexdigest()
+
+
+def __app_name(repo_name):
+    # benchmarks suffix repo names to start from cold indexes, the history stays the same
+    return repo_name.split('-repo')[0]
+
+
+def __stable_offset(name, modulo):
+    return int(hashlib.sha1(name.encode()).hexdigest(), 16) % modulo
+
+
+def __updated_on(number):
+    return (EPOCH + timedelta(minutes=number)).isoformat() + '+00:00'
+
+
+def __deployed_number(settings, app_name):
+    # keep the deployed build among the newest merges, like a fleet that deploys continuously
+    return settings.pull_requests - __stable_offset(app_name, 5)
+
+
+def __status(settings, env, app_name):
+    branch = DEV_BRANCH if env == 'dev' else RELEASE_BRANCH
+    number = __deployed_number(settings, app_name)
+    return {
+        "appBuild": __branch_tag_prefix[branch][1].format(number),
+        "gitCommitId": commit_hash(app_name, branch, number),
+        "gitBranch": "origin/" + branch,
+        "gitCommitTime": __updated_on(number)
+    }
+
+
+def __pull_request(repo_name, branch, number):
+    return {
+        'id': number,
+        'title': 'BENCH-{} change {} on {}'.format(number, number, branch),
+        'updated_on': __updated_on(number),
+        'merge_commit': {'hash': commit_hash(__app_name(repo_name), branch, number)[:12]},
+        'author': {'display_name': 'Author {}'.format(number % 17)},
+        'links': {'html': {'href': 'https://bitbucket.org/{}/pull-requests/{}'.format(repo_name, number)}}
+    }
+
+
+def __tag(repo_name, branch, number):
+    return {
+        'name': __branch_tag_prefix[branch][1].format(number),
+        'target': {'hash': commit_hash(__app_name(repo_name), branch, number)}
+    }
+
+
+def __changelog(settings, branch):
+    # the release branch was cut a few migrations ago
+    count = settings.migrations if branch == DEV_BRANCH else settings.migrations - 5
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<databaseChangeLog xmlns="http://www.liquibase.org/xml/ns/dbchangelog">']
+    lines.extend('    <include file="migrations/{:05d}.sql" relativeToChangelogFile="true"/>'.format(number)
+                 for number in range(1, count + 1))
+    lines.append('</databaseChangeLog>')
+    return '\n'.join(lines)
+
+
+def __page(values):
+    pagelen = int(request.args.get('pagelen', 10))
+    page = int(request.args.get('page', 1))
+    start = (page - 1) * pagelen
+    result = {'pagelen': pagelen, 'page': page, 'size': len(values), 'values': values[start:start + pagelen]}
+    if start + pagelen < len(values):
+        args = request.args.to_dict()
+        args['page'] = page + 1
+        result['next'] = '{}?{}'.format(request.base_url, urlencode(args))
+    return result
+
+
+def create_app(settings=None):
+    settings = settings or Settings()
+    app = Flask(__name__)
+    rng = random.Random(settings.seed)
+    rng_lock = threading.Lock()
+
+    def delay(latency, error_rate):
+        with rng_lock:
+            sleep, fail = rng.uniform(0.5 * latency, 1.5 * latency), rng.random() < error_rate
+        time.sleep(sleep)
+        if fail:
+            abort(503)
+
+    @app.route("/status/<env>/<app_name>/status", methods=['GET'])
+    def get_status(env, app_name):
+        delay(settings.status_latency, settings.status_error_rate)
+        return jsonify(__status(settings, env, app_name))
+
+    @app.route("/status/<env>/base-versions.json", methods=['GET'])
+    def get_base_versions(env):
+        delay(settings.status_latency, 0)
+        return jsonify({app_name: 'dev-0.0.{}'.format(__deployed_number(settings, app_name) - 20)
+                        for app_name in app_names(int(request.args.get('services', 0)))})
+
+    @app.route(API_PREFIX + "/repositories/<org>/<repo_name>/pullrequests", methods=['GET'])
+    def get_pull_requests(org, repo_name):
+        delay(settings.bitbucket_latency, settings.bitbucket_error_rate)
+        query = request.args.get('q', '')
+        destination = __destination_regex.search(query)
+        branch = destination.group(1) if destination else DEV_BRANCH
+        if branch not in __branch_tag_prefix:
+            return jsonify(__page([]))
+
+        since = __updated_on_regex.search(query)
+        values = [__pull_request(repo_name, branch, number) for number in range(settings.pull_requests, 0, -1)]
+        if since:
+            values = [pr for pr in values if pr['updated_on'] > since.group(1)]
+        return jsonify(__page(values))
+
+    @app.route(API_PREFIX + "/repositories/<org>/<repo_name>/refs/tags", methods=['GET'])
+    def get_tags(org, repo_name):
+        delay(settings.bitbucket_latency, settings.bitbucket_error_rate)
+        name = __name_regex.search(request.args.get('q', ''))
+        branches = [branch for branch, (prefix, _) in __branch_tag_prefix.items()
+                    if name is None or prefix.startswith(name.group(1))]
+        values = [__tag(repo_name, branch, number)
+                  for number in range(settings.pull_requests, 0, -1) for branch in branches]
+        return jsonify(__page(values))
+
+    @app.route(API_PREFIX + "/repositories/<org>/<repo_name>/refs/branches/<path:branch>", methods=['GET'])
+    def get_branch(org, repo_name, branch):
+        delay(settings.bitbucket_latency, settings.bitbucket_error_rate)
+        if branch not in __branch_tag_prefix:
+            abort(404)
+        head = commit_hash(__app_name(repo_name), branch, settings.pull_requests)
+        return jsonify({'name': branch, 'target': {'hash': head}})
+
+    @app.route(API_PREFIX + "/repositories/<org>/<repo_name>/commits/<path:branch>", methods=['GET'])
+    def get_commits(org, repo_name, branch):
+        delay(settings.bitbucket_latency, settings.bitbucket_error_rate)
+        if branch not in __branch_tag_prefix:
+            abort(404)
+        app_name = __app_name(repo_name)
+        values = [{'hash': commit_hash(app_name, branch, number),
+                   'parents': [{'hash': commit_hash(app_name, branch, number - 1)}] if number > 1 else []}
+                  for number in range(settings.pull_requests, 0, -1)]
+        return jsonify(__page(values))
+
+    @app.route(API_PREFIX + "/repositories/<org>/<repo_name>/src/<commit>/<path:path>", methods=['GET'])
+    def get_src(org, repo_name, commit, path):
+        delay(settings.bitbucket_latency, settings.bitbucket_error_rate)
+        for branch in __branch_tag_prefix:
+            if commit == commit_hash(__app_name(repo_name), branch, settings.pull_requests):
+                return Response(__changelog(settings, branch), content_type='application/xml')
+        abort(404)
+
+    return app
+
+
+def app_names(count):
+    return ['svc-{:04d}'.format(number) for number in range(1, count + 1)]
+
+
+def services_definition(count, status_url, repo_suffix=''):
+    return {
+        "envs": ["dev", "prod"],
+        "devEnvs": ["dev"],
+        "envTagPrefix": {"dev": "dev-", "prod": "release-"},
+        "baseVersionsUrls": {
+            "prod": '{}/status/prod/base-versions.json?services={}'.format(status_url, count)
+        },
+        "services": [
+            {
+                "name": app_name,
+                "repo": app_name + '-repo' + repo_suffix,
+                "hasDb": True,
+                "changelogFile": "db/changelog.xml",
+                "envs": {
+                    env: {"versionUrl": '{}/status/{}/{}/status'.format(status_url, env, app_name),
+                          "buildSystemUrl": "/job/{}/{{}}/".format(app_name)}
+                    for env in ("dev", "prod")
+                }
+            }
+            for app_name in app_names(count)
+        ]
+    }
+
+
+def write_services_file(path, count, status_url, repo_suffix=''):
+    with open(path, 'w') as f:
+        json.dump(services_definition(count, status_url, repo_suffix), f, indent=2)
+    return path
+
+
+class FakeUpstream:
+    def __init__(self, settings=None, host='127.0.0.1', port=0):
+        self.server = make_server(host, port, create_app(settings), threaded=True)
+        self.url = 'http://{}:{}'.format(host, self.server.server_port)
+        self.api_url = self.url + API_PREFIX
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-upstream', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fake Bitbucket API and status endpoint fleet')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--services', type=int, default=100, help='number of services in the generated file')
+    parser.add_argument('--services-file', help='write a tracker services file pointing at this server')
+    parser.add_argument('--status-latency', type=float, default=0.005)
+    parser.add_argument('--status-error-rate', type=float, default=0.01)
+    parser.add_argument('--bitbucket-latency', type=float, default=0.01)
+    parser.add_argument('--bitbucket-error-rate', type=float, default=0.0)
+    parser.add_argument('--pull-requests', type=int, default=200)
+    parser.add_argument('--migrations', type=int, default=300)
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(Settings(args.status_latency, args.status_error_rate, args.bitbucket_latency,
+                                     args.bitbucket_error_rate, args.pull_requests, args.migrations),
+                            args.host, args.port)
+    if args.services_file:
+        write_services_file(args.services_file, args.services, upstream.url)
+        logger.info("Wrote %d services to %s", args.services, args.services_file)
+    logger.info("Serving statuses at %s and the Bitbucket API at %s", upstream.url, upstream.api_url)
+    upstream.server.serve_forever()
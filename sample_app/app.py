@@ -1,7 +1,9 @@
 #!/usr/env python3
 
-from flask import Flask, jsonify
+from flask import Flask, abort, jsonify, request
 import logging
+import os
+import requests
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(format="%(asctime)s %(levelname)-8s [%(funcName)15s()] %(message)s")
@@ -9,6 +11,48 @@ logger.setLevel(logging.DEBUG)
 
 app = Flask(__name__)
 
+TRACKER_HOOK_URL = os.environ.get('TRACKER_HOOK_URL', 'http://localhost:5000/hooks/deployed')
+DEPLOY_HOOK_TOKEN = os.environ.get('DEPLOY_HOOK_TOKEN')
+
+statuses = {
+    ('dev', 'cat'): {
+        "appBuild": "dev-0.0.167",
+        "gitCommitId": "a7d80b5d5ca0c075aab5289fb622d34339654b63",
+        "gitBranch": "origin/devel",
+        "gitCommitTime": "2020-11-25T14:04:30+0100"
+    },
+    ('dev', 'dog'): {
+        "appBuild": "dev-0.0.36",
+        "gitCommitId": "4c004415419ef4c4e0d4bfaf736b89ce5e0e65de",
+        "gitBranch": "origin/devel",
+        "gitCommitTime": "2020-11-26T14:04:30+0100"
+    },
+    ('dev', 'dog-ui'): {
+        "appBuild": "dev-0.0.15",
+        "gitCommitId": "2517b828224158e208c5bc239674f66978a18290",
+        "gitBranch": "origin/devel",
+        "gitCommitTime": "2020-11-27T14:04:30+0100"
+    },
+    ('prod', 'cat'): {
+        "appBuild": "release-1.0.12",
+        "gitCommitId": "1a31edbfff0ce04cf8f5ed24d5af441780a9159b",
+        "gitBranch": "origin/release-1.0.0",
+        "gitCommitTime": "2020-11-26T14:04:30+0100"
+    },
+    ('prod', 'dog'): {
+        "appBuild": "release-1.0.12",
+        "gitCommitId": "9b1549d8fc9fa1fdf68430e6bf0db5094151c168",
+        "gitBranch": "origin/release-1.0.0",
+        "gitCommitTime": "2020-11-25T14:04:30+0100"
+    },
+    ('prod', 'dog-ui'): {
+        "appBuild": "release-1.0.12",
+        "gitCommitId": "90403a9bd51d25f97a09f10d44f02c46e1377f4a",
+        "gitBranch": "origin/release-1.0.0",
+        "gitCommitTime": "2020-11-27T14:04:30+0100"
+    },
+}
+
 
 @app.route("/prod/dog-ui/initial-dev-versions.json", methods=['GET'])
 def initial_dev_versions():
@@ -21,62 +65,48 @@ def initial_dev_versions():
 
 @app.route("/dev/cat/status", methods=["GET"])
 def get_dev_cat_status():
-    return jsonify({
-        "appBuild": "dev-0.0.167",
-        "gitCommitId": "a7d80b5d5ca0c075aab5289fb622d34339654b63",
-        "gitBranch": "origin/devel",
-        "gitCommitTime": "2020-11-25T14:04:30+0100"
-    })
+    return jsonify(statuses[('dev', 'cat')])
 
 
 @app.route("/dev/dog/status", methods=["GET"])
 def get_dev_dog_status():
-    return jsonify({
-        "appBuild": "dev-0.0.36",
-        "gitCommitId": "4c004415419ef4c4e0d4bfaf736b89ce5e0e65de",
-        "gitBranch": "origin/devel",
-        "gitCommitTime": "2020-11-26T14:04:30+0100"
-    })
+    return jsonify(statuses[('dev', 'dog')])
 
 
 @app.route("/dev/dog-ui/version.json", methods=["GET"])
 def get_dev_dog_ui_status():
-    return jsonify({
-        "appBuild": "dev-0.0.15",
-        "gitCommitId": "2517b828224158e208c5bc239674f66978a18290",
-        "gitBranch": "origin/devel",
-        "gitCommitTime": "2020-11-27T14:04:30+0100"
-    })
+    return jsonify(statuses[('dev', 'dog-ui')])
 
 
 @app.route("/prod/cat/status", methods=["GET"])
 def get_prod_cat_status():
-    return jsonify({
-        "appBuild": "release-1.0.12",
-        "gitCommitId": "1a31edbfff0ce04cf8f5ed24d5af441780a9159b",
-        "gitBranch": "origin/release-1.0.0",
-        "gitCommitTime": "2020-11-26T14:04:30+0100"
-    })
+    return jsonify(statuses[('prod', 'cat')])
 
 
 @app.route("/prod/dog/status", methods=["GET"])
 def get_prod_dog_status():
-    return jsonify({
-        "appBuild": "release-1.0.12",
-        "gitCommitId": "9b1549d8fc9fa1fdf68430e6bf0db5094151c168",
-        "gitBranch": "origin/release-1.0.0",
-        "gitCommitTime": "2020-11-25T14:04:30+0100"
-    })
+    return jsonify(statuses[('prod', 'dog')])
 
 
 @app.route("/prod/dog-ui/version.json", methods=["GET"])
 def get_prod_dog_ui_status():
-    return jsonify({
-        "appBuild": "release-1.0.12",
-        "gitCommitId": "90403a9bd51d25f97a09f10d44f02c46e1377f4a",
-        "gitBranch": "origin/release-1.0.0",
-        "gitCommitTime": "2020-11-27T14:04:30+0100"
-    })
+    return jsonify(statuses[('prod', 'dog-ui')])
+
+
+@app.route("/<env>/<app_name>/deploy", methods=["POST"])
+def deploy(env, app_name):
+    if (env, app_name) not in statuses:
+        abort(404)
+    statuses[(env, app_name)].update(request.get_json(force=True))
+
+    payload = dict(statuses[(env, app_name)], env=env, app=app_name)
+    try:
+        headers = {'X-Hook-Token': DEPLOY_HOOK_TOKEN} if DEPLOY_HOOK_TOKEN else {}
+        requests.post(TRACKER_HOOK_URL, json=payload, headers=headers, timeout=5).raise_for_status()
+    except requests.exceptions.RequestException as err:
+        logger.exception(f"Notifying tracker about {env}/{app_name} failed: {err}")
+
+    return jsonify(statuses[(env, app_name)])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+#!/usr/env python3
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tracker'))
+os.environ.setdefault('BITBUCKET_CACHE_BACKEND', 'memory')
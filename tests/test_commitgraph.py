@@ -0,0 +1,49 @@
+#!/usr/env python3
+
+import subprocess
+
+from reports import commitgraph
+from reports.config import Constants
+
+
+def git(path, *args):
+    return subprocess.run(['git', '-C', str(path), '-c', 'user.name=test', '-c', 'user.email=test@example.com'] +
+                          list(args), check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+
+
+def commit(path, message):
+    git(path, 'commit', '--quiet', '--allow-empty', '-m', message)
+    return git(path, 'rev-parse', 'HEAD')[:12]
+
+
+def test_mirror_graph_follows_merges_and_incremental_syncs(tmp_path, monkeypatch):
+    remote = tmp_path / 'remote'
+    remote.mkdir()
+    git(remote, 'init', '--quiet')
+    git(remote, 'checkout', '--quiet', '-b', 'devel')
+    root = commit(remote, 'root')
+    git(remote, 'checkout', '--quiet', '-b', 'feature')
+    feature = commit(remote, 'CAT-1 feature')
+    git(remote, 'checkout', '--quiet', 'devel')
+    other = commit(remote, 'CAT-2 other change')
+    git(remote, 'merge', '--quiet', '--no-ff', '-m', 'Merge CAT-1', 'feature')
+    merge = git(remote, 'rev-parse', 'HEAD')[:12]
+
+    monkeypatch.setattr(Constants, 'COMMIT_GRAPH_SOURCE', 'mirror')
+    monkeypatch.setattr(Constants, 'GIT_MIRROR_DIR', str(tmp_path / 'mirrors'))
+    monkeypatch.setattr(Constants, 'GIT_REMOTE_URL', str(tmp_path / '{repo}'))
+    monkeypatch.setattr(Constants, 'GIT_FETCH_INTERVAL', 0)
+
+    graph = commitgraph.synced_commit_graph('remote', 'devel')
+    assert len(graph) == 4
+    is_deployed = graph.reachability(other)
+    assert is_deployed(root) and not is_deployed(feature) and not is_deployed(merge)
+    is_deployed = graph.reachability(merge)
+    assert all(is_deployed(commit_id) for commit_id in (root, feature, other, merge))
+
+    later = commit(remote, 'CAT-3 later change')
+    assert commitgraph.synced_commit_graph('remote', 'devel') is graph
+    assert len(graph) == 5
+    assert graph.reachability(later)(feature)
+    assert not graph.reachability(feature)(later)
+    assert graph.reachability('0' * 12) is None
@@ -0,0 +1,104 @@
+#!/usr/env python3
+
+import time
+
+import pytest
+import requests
+
+from reports import fetcher
+from reports.config import Constants
+from reports.fetcher import CircuitBreaker, CircuitOpen
+
+
+class FakeResponse:
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'appBuild': 'dev-0.0.1'}
+
+
+class FakeSession:
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        return FakeResponse()
+
+
+def open_breaker():
+    breaker = CircuitBreaker('status.example.com')
+    for _ in range(Constants.CIRCUIT_FAILURE_THRESHOLD):
+        breaker.acquire()
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('status.example.com')
+    for _ in range(Constants.CIRCUIT_FAILURE_THRESHOLD - 1):
+        breaker.record_failure()
+    breaker.acquire()
+
+    breaker.record_failure()
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.acquire()
+    assert raised.value.since == breaker.since
+    assert breaker.unavailable_since() == breaker.since
+
+
+def test_breaker_lets_one_probe_through_and_backs_off_when_it_fails():
+    breaker = open_breaker()
+    breaker.probe_at = time.monotonic()
+    assert breaker.unavailable_since() is None
+
+    breaker.acquire()
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+
+    breaker.record_failure()
+    assert not breaker.probing
+    assert breaker.probe_interval == 2 * Constants.CIRCUIT_PROBE_INTERVAL
+    assert breaker.probe_at > time.monotonic()
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+
+
+def test_breaker_closes_when_the_probe_succeeds():
+    breaker = open_breaker()
+    breaker.probe_at = time.monotonic()
+    breaker.acquire()
+
+    breaker.record_success()
+    assert breaker.unavailable_since() is None
+    assert breaker.probe_interval == Constants.CIRCUIT_PROBE_INTERVAL
+    breaker.acquire()
+    breaker.acquire()
+
+
+def test_get_json_sends_the_probe_even_when_it_falls_due_during_the_fail_fast_check(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(fetcher, '__session', session)
+    url = 'http://probe.example.com/status'
+    breaker = fetcher.__dict__['__circuit_breaker']('probe.example.com')
+    for _ in range(Constants.CIRCUIT_FAILURE_THRESHOLD):
+        breaker.record_failure()
+
+    # every clock reading is a second later, the probe falls due right after the first one
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(fetcher.time, 'monotonic', lambda: next(clock))
+    breaker.probe_at = 1000.5
+
+    with pytest.raises(CircuitOpen):
+        fetcher.get_json(url)
+    assert session.urls == [] and not breaker.probing
+
+    assert fetcher.get_json(url) == {'appBuild': 'dev-0.0.1'}
+    assert session.urls == [url]
+    assert breaker.unavailable_since() is None and not breaker.probing
+
+
+def test_http_errors_do_not_count_against_the_host():
+    assert not fetcher.__dict__['__is_outage'](requests.exceptions.HTTPError('503 Server Error'))
+    assert fetcher.__dict__['__is_outage'](requests.exceptions.ConnectTimeout('timed out'))
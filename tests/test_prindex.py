@@ -0,0 +1,28 @@
+#!/usr/env python3
+
+from reports import bitbucket
+from reports.prindex import MergedPullRequests
+
+
+def pull_request(number, updated_on):
+    return {'id': number, 'title': 'CAT-{}'.format(number), 'updated_on': updated_on,
+            'merge_commit': {'hash': '{:012d}'.format(number)}}
+
+
+def test_sync_keeps_merge_order_when_old_pull_requests_are_updated(monkeypatch):
+    pages = {}
+
+    def get_json(url, revalidate=False):
+        return {'values': pages['sync' if 'updated_on%20%3E' in url else 'all']}
+
+    monkeypatch.setattr(bitbucket, 'get_json', get_json)
+    pages['all'] = [pull_request(number, '2020-01-01T00:00:0{}+00:00'.format(number)) for number in (5, 4, 3, 2, 1)]
+    index = MergedPullRequests('cat-repo', 'devel')
+    assert [pr['id'] for pr in index] == [5, 4, 3, 2, 1]
+
+    # PR 1 gets a comment long after its merge, PR 6 is merged
+    pages['sync'] = [pull_request(1, '2020-01-02T00:00:00+00:00'), pull_request(6, '2020-01-01T00:00:06+00:00')]
+    index.sync()
+    assert [pr['id'] for pr in index.known()] == [6, 5, 4, 3, 2, 1]
+    assert index.known()[-1]['updated_on'] == '2020-01-02T00:00:00+00:00'
+    assert index.synced_until == '2020-01-02T00:00:00+00:00'
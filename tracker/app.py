@@ -1,21 +1,154 @@
 #!/usr/env python3
 
-from flask import Flask, redirect
+from flask import Flask, Response, abort, jsonify, redirect, request
+from datetime import datetime, timezone
+import gzip
+import hashlib
+import hmac
+import json
 import logging
+import queue
+import time
 
+import requests
+
+from reports import bitbucket
 from reports import dbchangelog as dbchangelogreport
+from reports import featureindex
 from reports import pullrequests as prsreport
+from reports import metrics
+from reports.broadcast import Broadcaster
 from reports.config import ServicesData, Constants
+from reports.history import DeploymentHistory
+from reports.snapshot import ReportSnapshot
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(format=Constants.LOG_FORMAT)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(Constants.LOG_LEVEL)
 
 services_data = ServicesData()
+if not Constants.DEPLOY_HOOK_TOKEN and Constants.DEPLOY_HOOK_OPEN:
+    logger.warning("DEPLOY_HOOK_OPEN is set, anyone who can reach /hooks/deployed can record deployments")
+elif not Constants.DEPLOY_HOOK_TOKEN:
+    logger.warning("DEPLOY_HOOK_TOKEN is not set, /hooks/deployed rejects every call")
+history = DeploymentHistory()
+
+
+def build_versions_report():
+    report = prsreport.create_report(services_data)
+    history.record_report(report)
+    return report
+
+
+def publish_changes(previous, report):
+    if not viewers:
+        return
+    changes = prsreport.render_changed_cells(previous, report, services_data)
+    if changes is None:
+        viewers.publish('reload', {'generatedAt': report.generated_at})
+    elif changes:
+        viewers.publish('cells', {'generatedAt': report.generated_at, 'cells': changes})
+
+
+def build_feature_index():
+    return featureindex.create_index(versions_snapshot.get(), services_data)
+
+
+def refresh_feature_index(previous, report):
+    features_snapshot.request_refresh()
+
+
+viewers = Broadcaster()
+# deployments are pushed to /hooks/deployed, polling every status endpoint is only a slow reconciler
+versions_snapshot = ReportSnapshot('service_versions', build_versions_report,
+                                   refresh_interval=Constants.STATUS_RECONCILE_INTERVAL)
+versions_snapshot.add_listener(publish_changes)
+# added and removed services change the table, which only a full build picks up
+services_data.add_listener(versions_snapshot.request_refresh)
+# indexing pages merged PRs in from Bitbucket, so it runs after every report change and lookups only read the result
+features_snapshot = ReportSnapshot('features', build_feature_index,
+                                    refresh_interval=Constants.STATUS_RECONCILE_INTERVAL)
+versions_snapshot.add_listener(refresh_feature_index)
+versions_snapshot.start()
+features_snapshot.start()
 
 app = Flask(__name__)
 
 
+def json_representation(report):
+    data = report.to_dict()
+    # the ETag only covers the report content, so rebuilding an unchanged report still yields 304s
+    content = {key: value for key, value in data.items() if key not in ('generatedAt', 'buildTime')}
+    etag = hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+    body = json.dumps(data, separators=(',', ':')).encode()
+    return body, gzip.compress(body), etag
+
+
+def json_response(representation):
+    body, gzipped, etag = representation
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = Response(gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        etag += '-gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def snapshot_response(response):
+    response.headers['X-Report-Age'] = '{:.0f}'.format(versions_snapshot.age())
+    response.headers['X-Report-Generated-At'] = versions_snapshot.built_at.isoformat()
+    return response
+
+
+def selection(name, known):
+    value = request.args.get(name)
+    if not value:
+        return None
+    selected = [item for item in value.split(',') if item]
+    unknown = set(selected) - set(known)
+    if unknown:
+        abort(400, 'Unknown {}: {}'.format(name, ', '.join(sorted(unknown))))
+    return selected
+
+
+def feature_index():
+    return features_snapshot.get()
+
+
+def refresh_cells(apps=None, envs=None, statuses=None):
+    partial = prsreport.create_report(services_data, apps, envs, statuses)
+    history.record_report(partial)
+    versions_snapshot.update(lambda report: report.merge(partial))
+    return partial
+
+
+def parse_time(value):
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def time_argument(name, default=None):
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return parse_time(value)
+    except ValueError:
+        abort(400, 'Invalid {}: {}'.format(name, value))
+
+
+def refresh_selected_cells():
+    apps = selection('apps', services_data.get_app_names())
+    envs = selection('envs', services_data.envs)
+    if apps or envs:
+        refresh_cells(apps, envs)
+
+
 @app.route("/", methods=["GET"])
 def main():
     return redirect(Constants.CACHED_VERSIONS_REPORT)
@@ -23,21 +156,188 @@ def main():
 
 @app.route("/service-versions", methods=['GET'])
 def refresh():
-    file = "/tmp/environments-report.html"
-    prsreport.create_report(file, services_data)
-    with open(file, 'r') as file:
-        return file.read()
+    if request.args.get('refresh'):
+        versions_snapshot.rebuild()
+    refresh_selected_cells()
+    html = versions_snapshot.derived('html', lambda report: ''.join(prsreport.render_report(report, services_data)))
+    return snapshot_response(Response(html, mimetype='text/html'))
+
+
+@app.route("/service-versions/events", methods=['GET'])
+def service_versions_events():
+    subscriber = viewers.subscribe()
+    if subscriber is None:
+        logger.warning("Turning down a live viewer, %d are connected already", len(viewers))
+        response = Response('retry: {}\n\n'.format(1000 * Constants.EVENTS_RETRY_INTERVAL), status=503,
+                            mimetype='text/event-stream')
+        response.headers['Retry-After'] = str(Constants.EVENTS_RETRY_INTERVAL)
+        return response
+
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    message = subscriber.get(timeout=Constants.EVENTS_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    message = ': keepalive\n\n'
+                if message is None:
+                    return
+                yield message
+        finally:
+            viewers.unsubscribe(subscriber)
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route("/service-versions/refresh", methods=['POST'])
+def request_refresh():
+    versions_snapshot.request_refresh()
+    return '', 202
+
+
+@app.route("/api/service-versions", methods=['GET'])
+def get_service_versions():
+    refresh_selected_cells()
+    return snapshot_response(json_response(versions_snapshot.derived('json', json_representation)))
+
+
+@app.route("/service-versions/<env>/<app_name>", methods=['GET', 'POST'])
+def refresh_service_version(env, app_name):
+    if env not in services_data.envs or app_name not in services_data.services:
+        abort(404)
+    partial = refresh_cells([app_name], [env])
+    return jsonify(partial.envs[env].cells[app_name].to_dict())
+
+
+@app.route("/features/<key>", methods=['GET'])
+def get_feature(key):
+    deployments = feature_index().lookup(key)
+    if deployments is None:
+        abort(404)
+    return snapshot_response(jsonify({'key': featureindex.normalize_key(key), 'deployments': deployments}))
+
+
+@app.route("/features", methods=['GET', 'POST'])
+def get_features():
+    if request.method == 'POST':
+        keys = (request.get_json(force=True, silent=True) or {}).get('keys')
+    else:
+        keys = [key for key in request.args.get('keys', '').split(',') if key]
+    if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+        abort(400, 'Expected a list of keys')
+    return snapshot_response(jsonify(feature_index().lookup_all(keys)))
+
+
+@app.route("/history/service-versions", methods=['GET'])
+def get_history_snapshot():
+    at = time_argument('at', time.time())
+    return jsonify({'at': datetime.utcfromtimestamp(at).isoformat(timespec='seconds'),
+                    'envs': history.snapshot(at)})
+
+
+@app.route("/history/deployments", methods=['GET'])
+def get_history_deployments():
+    return jsonify(history.changes(request.args.get('env'), request.args.get('app'),
+                                   time_argument('since'), time_argument('until'),
+                                   max(1, min(request.args.get('limit', 1000, type=int), 10000))))
+
+
+@app.route("/history/lead-times/<env>", methods=['GET'])
+def get_lead_times(env):
+    if env not in services_data.envs:
+        abort(404)
+    return jsonify(history.lead_times(env, time_argument('since'), time_argument('until')))
+
+
+@app.route("/history/lead-time/<app_name>/<commit_id>", methods=['GET'])
+def get_commit_lead_time(app_name, commit_id):
+    if app_name not in services_data.services:
+        abort(404)
+    commit_id = commit_id.lower()[:12]
+
+    def contains(env, build, deployed_commit_id):
+        return deployed_commit_id == commit_id or featureindex.deployed_commits(
+            services_data, env, app_name, build, deployed_commit_id)(commit_id)
+
+    # the merge commit's own date, a PR's updated_on keeps moving with comments after the merge
+    try:
+        merged = bitbucket.get_commit(services_data.services[app_name].general_config.repo_name, commit_id)['date']
+        merged_at = parse_time(merged)
+    except (requests.exceptions.RequestException, KeyError, TypeError, ValueError) as err:
+        logger.warning("Merge date of %s/%s unavailable: %s", app_name, commit_id, err)
+        merged, merged_at = None, None
+    deployments = history.first_deployed(app_name, contains, merged_at, time_argument('since'))
+    return jsonify({'app': app_name, 'commitId': commit_id, 'mergedAt': merged, 'envs': deployments})
+
+
+@app.route("/metrics", methods=['GET'])
+def get_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/hooks/deployed", methods=['POST'])
+def deployed():
+    # hook calls are written to the deployment history, an open hook has to be asked for explicitly
+    if Constants.DEPLOY_HOOK_TOKEN:
+        if not hmac.compare_digest(request.headers.get('X-Hook-Token', '').encode(),
+                                   Constants.DEPLOY_HOOK_TOKEN.encode()):
+            abort(403)
+    elif not Constants.DEPLOY_HOOK_OPEN:
+        abort(403, 'Set DEPLOY_HOOK_TOKEN to accept deploy hooks')
+
+    payload = request.get_json(force=True, silent=True)
+    if not isinstance(payload, dict):
+        abort(400, 'Expected a JSON object')
+    env, app_name = payload.get('env'), payload.get('app')
+    if not isinstance(env, str) or not isinstance(app_name, str) \
+            or env not in services_data.envs or app_name not in services_data.services:
+        abort(400, 'Unknown env or app: {}/{}'.format(env, app_name))
+    invalid = [key for key in ('appBuild', 'gitCommitId', 'gitCommitTime') if not isinstance(payload.get(key), str)]
+    if invalid:
+        abort(400, 'Missing or invalid fields: {}'.format(', '.join(invalid)))
+
+    logger.info("Deployed %s %s to %s", app_name, payload['appBuild'], env)
+    partial = refresh_cells([app_name], [env], {(env, app_name): payload})
+    return jsonify(partial.envs[env].cells[app_name].to_dict())
 
 
 @app.route("/dbchangelogs/diff/<version>", methods=["GET"])
 def get_dbchangelogs_diff(version):
+    report = dbchangelogreport.create_report(version, services_data)
+    return Response(dbchangelogreport.render_report(report), mimetype='text/html')
+
+
+def matrix_branches():
+    versions = [version for version in request.args.get('versions', '').split(',') if version]
+    if versions:
+        return [dbchangelogreport.release_branch(version) for version in versions]
+    # without versions, audit every release branch something is currently deployed from
+    return dbchangelogreport.deployed_release_branches(versions_snapshot.get(), services_data)
+
+
+@app.route("/dbchangelogs/matrix", methods=["GET"])
+def get_dbchangelogs_matrix():
+    report = dbchangelogreport.create_matrix_report(matrix_branches(), services_data)
+    return Response(dbchangelogreport.render_matrix_report(report), mimetype='text/html')
+
+
+@app.route("/api/dbchangelogs/matrix", methods=["GET"])
+def get_dbchangelogs_matrix_json():
+    return json_response(json_representation(dbchangelogreport.create_matrix_report(matrix_branches(),
+                                                                                   services_data)))
+
 
-    file = "/tmp/migrations-report.html"
-    dbchangelogreport.create_report(file, version, services_data)
-    with open(file, "r") as file:
-        return file.read()
+@app.route("/api/dbchangelogs/diff/<version>", methods=["GET"])
+def get_dbchangelogs_diff_json(version):
+    return json_response(json_representation(dbchangelogreport.create_report(version, services_data)))
 
 
 if __name__ == "__main__":
     from waitress import serve
-    serve(app, host="0.0.0.0", port=5000)
+    # every live viewer holds a thread, see EVENTS_MAX_SUBSCRIBERS
+    serve(app, host="0.0.0.0", port=5000, threads=Constants.SERVER_THREADS)
@@ -0,0 +1,150 @@
+#!/usr/env python3
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+
+from . import metrics
+from .cache import CacheEntry, create_cache
+from .config import Constants
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+class BitbucketAuth(HTTPBasicAuth):
+    # credentials are read on the first request, so importing the reports does not require them
+    def __init__(self):
+        super().__init__(None, None)
+
+    def __call__(self, r):
+        self.username = Constants.BITBUCKET_USER
+        self.password = Constants.BITBUCKET_API_KEY
+        return super().__call__(r)
+
+
+def __create_session():
+    session = requests.Session()
+    session.auth = BitbucketAuth()
+    retry = Retry(total=Constants.BITBUCKET_RETRIES, connect=1, read=1, backoff_factor=Constants.BITBUCKET_BACKOFF,
+                  status_forcelist=[429, 502, 503, 504], respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=Constants.BITBUCKET_CONCURRENCY,
+                          pool_maxsize=Constants.BITBUCKET_CONCURRENCY, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+__session = __create_session()
+__cache = create_cache()
+__revalidator = ThreadPoolExecutor(max_workers=Constants.BITBUCKET_REVALIDATE_WORKERS)
+__revalidating = set()
+__revalidating_lock = threading.Lock()
+
+
+def __fetch(url, entry=None):
+    headers = entry.validators() if entry else {}
+    with metrics.upstream(url):
+        r = __session.get(url, headers=headers, timeout=Constants.BITBUCKET_TIMEOUT)
+        not_modified = r.status_code == 304 and entry is not None
+        if not not_modified:
+            r.raise_for_status()
+    now = time.time()
+
+    if not_modified:
+        logger.debug("Not modified: %s", url)
+        metrics.cache_lookup('bitbucket', 'revalidated')
+        entry = CacheEntry(entry.body, entry.etag, entry.last_modified, now)
+    else:
+        entry = CacheEntry(r.text, r.headers.get('ETag'), r.headers.get('Last-Modified'), now)
+
+    __cache.set(url, entry)
+    return entry
+
+
+def __revalidate_in_background(url, entry):
+    with __revalidating_lock:
+        if url in __revalidating:
+            return
+        __revalidating.add(url)
+
+    def revalidate():
+        try:
+            __fetch(url, entry)
+        except requests.exceptions.RequestException as err:
+            logger.warning("Revalidating %s failed: %s", url, err)
+        finally:
+            with __revalidating_lock:
+                __revalidating.discard(url)
+
+    __revalidator.submit(revalidate)
+
+
+def get_json(url, revalidate=False):
+    entry = __cache.get(url)
+    if entry and revalidate:
+        # still a conditional request, an unchanged response costs a 304
+        metrics.cache_lookup('bitbucket', 'bypassed')
+    elif entry:
+        age = time.time() - entry.fetched_at
+        if age < Constants.BITBUCKET_CACHE_TTL:
+            metrics.cache_lookup('bitbucket', 'hit')
+            return entry.value
+        if age < Constants.BITBUCKET_CACHE_TTL + Constants.BITBUCKET_CACHE_STALE_TTL:
+            metrics.cache_lookup('bitbucket', 'stale')
+            __revalidate_in_background(url, entry)
+            return entry.value
+        metrics.cache_lookup('bitbucket', 'expired')
+    else:
+        metrics.cache_lookup('bitbucket', 'miss')
+
+    return __fetch(url, entry).value
+
+
+def get_immutable_text(url):
+    entry = __cache.get(url)
+    if entry:
+        metrics.cache_lookup('bitbucket_immutable', 'hit')
+        return entry.body
+
+    metrics.cache_lookup('bitbucket_immutable', 'miss')
+    with metrics.upstream(url):
+        r = __session.get(url, timeout=Constants.BITBUCKET_TIMEOUT)
+        r.raise_for_status()
+    __cache.set(url, CacheEntry(r.text, fetched_at=time.time()), immutable=True)
+    return r.text
+
+
+def get_commit_hash(repo_name, branch):
+    url = '{}/repositories/{}/{}/refs/branches/{}'.format(Constants.BITBUCKET_API_URL, Constants.ATLASSIAN_ORG_NAME,
+                                                          repo_name, branch)
+    return get_json(url)['target']['hash']
+
+
+def get_commit(repo_name, commit_id):
+    # a commit never changes once it exists
+    url = '{}/repositories/{}/{}/commit/{}'.format(Constants.BITBUCKET_API_URL, Constants.ATLASSIAN_ORG_NAME,
+                                                   repo_name, commit_id)
+    return json.loads(get_immutable_text(url))
+
+
+def iter_pages(url, max_pages=None, revalidate=False):
+    pages = 0
+    while url and (max_pages is None or pages < max_pages):
+        page = get_json(url, revalidate)
+        pages += 1
+        yield page
+        url = page.get('next')
+
+
+def iter_values(url, max_pages=None, revalidate=False):
+    for page in iter_pages(url, max_pages, revalidate):
+        yield from page.get('values', [])
@@ -0,0 +1,56 @@
+#!/usr/env python3
+
+import json
+import logging
+import queue
+import threading
+
+from .config import Constants
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+def event_message(event, data):
+    return 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data, separators=(',', ':')))
+
+
+class Broadcaster:
+    def __init__(self, queue_size=Constants.EVENTS_QUEUE_SIZE, max_subscribers=Constants.EVENTS_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        # formatted once, every subscriber gets the very same string
+        message = event_message(event, data)
+        with self.lock:
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # a viewer that cannot keep up is dropped, its client reconnects and reloads the page
+                self.unsubscribe(subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(None)
+        return len(subscribers)
@@ -0,0 +1,115 @@
+#!/usr/env python3
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from cachetools import LRUCache
+
+from .config import Constants
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+class CacheEntry:
+    def __init__(self, body: str, etag: str = None, last_modified: str = None, fetched_at: float = 0):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.__value = None
+
+    @property
+    def value(self):
+        if self.__value is None:
+            self.__value = json.loads(self.body)
+        return self.__value
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class MemoryCache:
+    def __init__(self, maxsize=Constants.BITBUCKET_CACHE_MAXSIZE):
+        self.__entries = LRUCache(maxsize=maxsize)
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        with self.__lock:
+            return self.__entries.get(key)
+
+    def set(self, key, entry: CacheEntry, immutable=False):
+        with self.__lock:
+            self.__entries[key] = entry
+
+
+class SqliteCache:
+    def __init__(self, path, max_age=Constants.BITBUCKET_CACHE_TTL + Constants.BITBUCKET_CACHE_STALE_TTL):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_age = max_age
+        self.__lock = threading.Lock()
+        # parsed entries of recent hits, so a hit does not read and parse the body again
+        self.__recent = MemoryCache()
+        self.__expired_at = 0
+        self.__db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                          'key TEXT PRIMARY KEY, body TEXT NOT NULL, etag TEXT, last_modified TEXT, '
+                          'fetched_at REAL NOT NULL, immutable INTEGER NOT NULL DEFAULT 0)')
+        if 'immutable' not in {column[1] for column in self.__db.execute('PRAGMA table_info(responses)')}:
+            self.__db.execute('ALTER TABLE responses ADD COLUMN immutable INTEGER NOT NULL DEFAULT 0')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS responses_fetched_at ON responses (fetched_at)')
+        self.__db.commit()
+
+    def get(self, key):
+        entry = self.__recent.get(key)
+        if entry is not None:
+            return entry
+        with self.__lock:
+            row = self.__db.execute('SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?',
+                                    (key,)).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(*row)
+        self.__recent.set(key, entry)
+        return entry
+
+    def __expire(self, now):
+        # incremental sync URLs embed a timestamp and are never requested again, so old rows must go
+        if now - self.__expired_at < Constants.BITBUCKET_CACHE_EXPIRE_INTERVAL:
+            return 0
+        self.__expired_at = now
+        return self.__db.execute('DELETE FROM responses WHERE immutable = 0 AND fetched_at < ?',
+                                 (now - self.max_age,)).rowcount
+
+    def set(self, key, entry: CacheEntry, immutable=False):
+        self.__recent.set(key, entry)
+        with self.__lock:
+            self.__db.execute('INSERT OR REPLACE INTO responses (key, body, etag, last_modified, fetched_at, '
+                              'immutable) VALUES (?, ?, ?, ?, ?, ?)',
+                              (key, entry.body, entry.etag, entry.last_modified, entry.fetched_at, int(immutable)))
+            expired = self.__expire(time.time())
+            self.__db.commit()
+        if expired:
+            logger.info("Expired %d cached responses", expired)
+
+
+def create_cache(backend=Constants.BITBUCKET_CACHE_BACKEND, path=Constants.BITBUCKET_CACHE_PATH):
+    if backend == 'sqlite':
+        logger.info("Using sqlite response cache at %s", path)
+        return SqliteCache(path)
+    if backend == 'memory':
+        return MemoryCache()
+    raise ValueError('Unknown cache backend: {}'.format(backend))
@@ -0,0 +1,183 @@
+#!/usr/env python3
+
+import base64
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from cachetools import LRUCache
+
+from . import bitbucket
+from .config import Constants
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+class CommitGraph:
+    def __init__(self, repo_name: str):
+        self.repo_name = repo_name
+        self.indexes = {}
+        self.commits = []
+        self.parents = []
+        self.generations = []
+        self.heads = set()
+        self.fetched_at = None
+        self.ancestor_bitmaps = LRUCache(maxsize=Constants.COMMIT_GRAPH_BITMAP_CACHE_SIZE)
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.commits)
+
+    def add(self, commits: dict):
+        # parents always get a lower position than their children, so a commit's ancestors all sit before it
+        for commit_id in commits:
+            stack = [commit_id]
+            while stack:
+                current = stack[-1]
+                if current in self.indexes:
+                    stack.pop()
+                    continue
+                missing = [parent for parent in commits.get(current, ())
+                           if parent in commits and parent not in self.indexes]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                stack.pop()
+                # parents older than what was fetched are unknown, the commit is a root as far as we can tell
+                parents = tuple(self.indexes[parent] for parent in commits[current] if parent in self.indexes)
+                position = len(self.commits)
+                self.commits.append(current)
+                self.parents.append(parents)
+                self.generations.append(1 + max((self.generations[parent] for parent in parents), default=0))
+                # published last, lookups without the lock only find commits that are fully added
+                self.indexes[current] = position
+
+    def ancestors(self, commit_id):
+        with self.lock:
+            position = self.indexes.get(commit_id)
+            if position is None:
+                return None
+            bitmap = self.ancestor_bitmaps.get(position)
+            if bitmap is None:
+                bits = bytearray((position >> 3) + 1)
+                stack = [position]
+                while stack:
+                    current = stack.pop()
+                    byte, bit = current >> 3, 1 << (current & 7)
+                    if bits[byte] & bit:
+                        continue
+                    bits[byte] |= bit
+                    stack.extend(self.parents[current])
+                # the ancestors of a commit never change, new commits only ever add descendants
+                bitmap = self.ancestor_bitmaps[position] = bytes(bits)
+            return bitmap
+
+    def reachability(self, commit_id):
+        bitmap = self.ancestors(commit_id)
+        if bitmap is None:
+            return None
+        generation = self.generations[self.indexes[commit_id]]
+
+        def is_ancestor(other_id):
+            position = self.indexes.get(other_id)
+            if position is None or self.generations[position] > generation or position >> 3 >= len(bitmap):
+                return False
+            return bool(bitmap[position >> 3] & (1 << (position & 7)))
+
+        return is_ancestor
+
+
+def __bitbucket_commits(graph, branch):
+    url = '{}/repositories/{}/{}/commits/{}?pagelen={}'.format(Constants.BITBUCKET_API_URL,
+                                                                Constants.ATLASSIAN_ORG_NAME, graph.repo_name, branch,
+                                                                Constants.COMMIT_GRAPH_PAGELEN)
+    commits = {}
+    for page in bitbucket.iter_pages(url, max_pages=Constants.COMMIT_GRAPH_MAX_PAGES):
+        values = page.get('values', [])
+        for commit in values:
+            commit_id = commit['hash'][:12]
+            if commit_id not in graph.indexes:
+                commits[commit_id] = tuple(parent['hash'][:12] for parent in commit.get('parents', []))
+        # commits come newest first, a page with nothing new means the rest is known too
+        if all(commit['hash'][:12] in graph.indexes for commit in values):
+            break
+    return commits
+
+
+def __git(*args, remote=False):
+    env = dict(os.environ)
+    if remote and Constants.GIT_REMOTE_URL.startswith('https://'):
+        credentials = '{}:{}'.format(Constants.BITBUCKET_USER, Constants.BITBUCKET_API_KEY)
+        # passed through the environment so the credentials do not show up in the process list
+        env.update({'GIT_CONFIG_COUNT': '1',
+                    'GIT_CONFIG_KEY_0': 'http.extraHeader',
+                    'GIT_CONFIG_VALUE_0': 'Authorization: Basic ' + base64.b64encode(credentials.encode()).decode()})
+    return subprocess.run(['git'] + list(args), env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, timeout=Constants.GIT_TIMEOUT).stdout
+
+
+def __update_mirror(graph):
+    path = os.path.join(Constants.GIT_MIRROR_DIR, graph.repo_name + '.git')
+    if not os.path.isdir(path):
+        os.makedirs(Constants.GIT_MIRROR_DIR, exist_ok=True)
+        remote = Constants.GIT_REMOTE_URL.format(org=Constants.ATLASSIAN_ORG_NAME, repo=graph.repo_name)
+        logger.info("Cloning %s into %s", remote, path)
+        __git('clone', '--mirror', '--quiet', remote, path, remote=True)
+        graph.fetched_at = time.monotonic()
+    elif graph.fetched_at is None or time.monotonic() - graph.fetched_at > Constants.GIT_FETCH_INTERVAL:
+        __git('-C', path, 'fetch', '--prune', '--quiet', remote=True)
+        graph.fetched_at = time.monotonic()
+    return path
+
+
+def __mirror_commits(graph, branch):
+    path = __update_mirror(graph)
+    ref = 'refs/heads/' + branch
+    args = ['-C', path, 'rev-list', '--parents', '--topo-order', '--reverse', ref]
+    if graph.heads:
+        args += ['--not'] + sorted(graph.heads)
+
+    commits = {}
+    for line in __git(*args).splitlines():
+        ids = [commit_hash[:12] for commit_hash in line.split()]
+        commits[ids[0]] = tuple(ids[1:])
+    graph.heads.add(__git('-C', path, 'rev-parse', ref).strip())
+    return commits
+
+
+__sources = {'bitbucket': __bitbucket_commits, 'mirror': __mirror_commits}
+__graphs = {}
+__graphs_lock = threading.Lock()
+
+
+def enabled():
+    return bool(Constants.COMMIT_GRAPH_SOURCE)
+
+
+def known_commit_graph(repo_name):
+    with __graphs_lock:
+        return __graphs.get(repo_name)
+
+
+def synced_commit_graph(repo_name, branch):
+    if Constants.COMMIT_GRAPH_SOURCE not in __sources:
+        raise ValueError('Unknown commit graph source: {}'.format(Constants.COMMIT_GRAPH_SOURCE))
+
+    with __graphs_lock:
+        if repo_name not in __graphs:
+            __graphs[repo_name] = CommitGraph(repo_name)
+        graph = __graphs[repo_name]
+
+    # fetching can take minutes, lookups only wait for the graph to be extended
+    with graph.sync_lock:
+        commits = __sources[Constants.COMMIT_GRAPH_SOURCE](graph, branch)
+        with graph.lock:
+            graph.add(commits)
+    if commits:
+        logger.info("%s/%s: added %d commits, %d in the graph", repo_name, branch, len(commits), len(graph))
+    return graph
@@ -1,17 +1,102 @@
+import json
+import logging
 import os
+import threading
+import time
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+
+class EnvironmentVariable:
+    def __init__(self, name: str, default: str = None, required: bool = False):
+        self.name = name
+        self.default = default
+        self.required = required
+
+    def __get__(self, instance, owner):
+        if self.required:
+            return os.environ[self.name]
+        return os.environ.get(self.name, self.default)
 
 
 class Constants:
     RELEASE_TAG_PREFIX = "release-"
     DEV_TAG_PREFIX = "dev-"
     LOG_FORMAT = "%(asctime)s %(levelname)-8s [%(funcName)15s()] %(message)s"
+    LOG_LEVEL = os.environ.get('TRACKER_LOG_LEVEL', 'INFO')
     ATLASSIAN_ORG_NAME = 'mysuperorg'
-    CACHED_VERSIONS_REPORT = "http://localhost:9000/cached_versions_report"
-    BITBUCKET_API_URL = "https://api.bitbucket.org/2.0"
-    BITBUCKET_USER = os.environ['BITBUCKET_USER']
-    BITBUCKET_API_KEY = os.environ['BITBUCKET_API_KEY']
+    CACHED_VERSIONS_REPORT = "/service-versions"
+    BITBUCKET_API_URL = os.environ.get('BITBUCKET_API_URL', "https://api.bitbucket.org/2.0")
+    BITBUCKET_USER = EnvironmentVariable('BITBUCKET_USER', required=True)
+    BITBUCKET_API_KEY = EnvironmentVariable('BITBUCKET_API_KEY', required=True)
     JIRA_URL = "https://{}.atlassian.net/browse"
     BUILD_SYSTEM_URL = 'http://localhost:9001/builds/'
+    STATUS_FETCH_CONCURRENCY = 32
+    STATUS_FETCH_PER_HOST = 8
+    STATUS_FETCH_TIMEOUT = 5
+    STATUS_FETCH_CONNECT_TIMEOUT = 2
+    STATUS_FETCH_DEADLINE = 10
+    CIRCUIT_FAILURE_THRESHOLD = 3
+    CIRCUIT_PROBE_INTERVAL = 5
+    CIRCUIT_MAX_PROBE_INTERVAL = 300
+    SNAPSHOT_REFRESH_INTERVAL = 60
+    STATUS_RECONCILE_INTERVAL = 600
+    DEPLOY_HOOK_TOKEN = os.environ.get('DEPLOY_HOOK_TOKEN')
+    DEPLOY_HOOK_OPEN = os.environ.get('DEPLOY_HOOK_OPEN', '').lower() in ('1', 'true', 'yes')
+    BITBUCKET_TIMEOUT = 10
+    BITBUCKET_CONCURRENCY = 8
+    BITBUCKET_RETRIES = 5
+    BITBUCKET_BACKOFF = 0.5
+    BITBUCKET_DEADLINE = 60
+    BITBUCKET_CACHE_BACKEND = os.environ.get('BITBUCKET_CACHE_BACKEND', 'sqlite')
+    BITBUCKET_CACHE_PATH = os.environ.get('BITBUCKET_CACHE_PATH',
+                                          os.path.expanduser('~/.cache/features-vs-envs-tracker/bitbucket.sqlite'))
+    BITBUCKET_CACHE_MAXSIZE = 1024
+    BITBUCKET_CACHE_TTL = 300
+    BITBUCKET_CACHE_STALE_TTL = 3600
+    BITBUCKET_CACHE_EXPIRE_INTERVAL = 600
+    BITBUCKET_REVALIDATE_WORKERS = 4
+    PR_ROWS = 10
+    PR_PAGELEN = 50
+    PR_MAX_PAGES = 20
+    FEATURE_INDEX_PAGES = 10
+    TAG_PAGELEN = 100
+    TAG_MAX_PAGES = 20
+    TAG_REBUILD_INTERVAL = 3600
+    VERSION_CACHE_SIZE = 65536
+    COMMIT_GRAPH_SOURCE = os.environ.get('TRACKER_COMMIT_GRAPH')
+    COMMIT_GRAPH_PAGELEN = 100
+    COMMIT_GRAPH_MAX_PAGES = 20
+    COMMIT_GRAPH_BITMAP_CACHE_SIZE = 4096
+    GIT_MIRROR_DIR = os.environ.get('TRACKER_GIT_MIRROR_DIR',
+                                    os.path.expanduser('~/.cache/features-vs-envs-tracker/mirrors'))
+    GIT_REMOTE_URL = os.environ.get('TRACKER_GIT_REMOTE_URL', 'https://bitbucket.org/{org}/{repo}.git')
+    GIT_FETCH_INTERVAL = 60
+    GIT_TIMEOUT = 300
+    CHANGELOG_DEADLINE = 20
+    CHANGELOG_FOLLOW_INCLUDES = os.environ.get('TRACKER_CHANGELOG_FOLLOW_INCLUDES', '').lower() in ('1', 'true', 'yes')
+    CHANGELOG_PARSE_CHUNK = 64 * 1024
+    CHANGELOG_PARSE_CACHE_SIZE = 256
+    JIRA_LINK_CACHE_SIZE = 8192
+    RENDER_BUFFER_SIZE = 64
+    RENDER_TIME_BUDGET = 0.2
+    RENDER_TIME_MIN_WARNING = 0.05
+    SERVER_THREADS = int(os.environ.get('TRACKER_THREADS', 64))
+    EVENTS_QUEUE_SIZE = 16
+    # every viewer holds a server thread, the other half is kept for everything else
+    EVENTS_MAX_SUBSCRIBERS = max(1, SERVER_THREADS // 2)
+    EVENTS_RETRY_INTERVAL = 30
+    EVENTS_KEEPALIVE_INTERVAL = 15
+    HISTORY_PATH = os.environ.get('TRACKER_HISTORY_PATH',
+                                  os.path.expanduser('~/.cache/features-vs-envs-tracker/history.sqlite'))
+    SERVICES_FILE = os.environ.get('TRACKER_SERVICES_FILE',
+                                   os.path.join(os.path.dirname(os.path.dirname(__file__)), 'services.json'))
+    SERVICES_RELOAD_CHECK_INTERVAL = 5
 
     @classmethod
     def build_system_url(cls, url):
@@ -19,6 +104,8 @@ class Constants:
 
 
 class EnvConfig:
+    __slots__ = ('env', 'version_url', 'build_system_url')
+
     def __init__(self, env: str, version_url: str, build_system_url: str = ''):
         self.env = env
         self.version_url = version_url
@@ -26,6 +113,8 @@ class EnvConfig:
 
 
 class GeneralConfig:
+    __slots__ = ('repo_name', 'has_db', 'changelog_file')
+
     def __init__(self, repo_name: str, has_db: bool = False, changelog_file: str = None):
         self.repo_name = repo_name
         self.has_db = has_db
@@ -33,6 +122,8 @@ class GeneralConfig:
 
 
 class ServiceConfig:
+    __slots__ = ('name', 'general_config', 'env_configs', 'order')
+
     def __init__(self, name: str, general_config: GeneralConfig):
         self.name = name
         self.general_config = general_config
@@ -46,55 +137,125 @@ class ServiceConfig:
         return self.env_configs[env].version_url
 
 
-class ServicesData:
+class ServicesRegistry:
+    __slots__ = ('services', 'envs', 'dev_envs', 'release_envs', 'env_indexes', 'env_tag_prefix',
+                 'base_versions_urls', 'app_names', 'app_names_with_db')
 
-    def __init__(self):
+    def __init__(self, definition: dict):
         self.services = {}
-        self.__num__ = 0
-        self.envs = ['dev', 'prod']
-        self.dev_envs = ['dev']
+        self.envs = list(definition['envs'])
+        self.dev_envs = list(definition.get('devEnvs', []))
         self.release_envs = set(self.envs) - set(self.dev_envs)
-        self.env_tag_prefix = {
-            'dev': Constants.DEV_TAG_PREFIX,
-            'prod': Constants.RELEASE_TAG_PREFIX
-        }
-
-        self.base_versions_urls = {
-            'prod': 'http://localhost:8081/prod/dog-ui/initial-dev-versions.json'
-        }
-
-        service = ServiceConfig('cat', GeneralConfig('cat-repo', True, 'cat/db/changelog.xml'))
-        bs_url = Constants.build_system_url('/job/cat/{}/')
-        service.add_env(EnvConfig(env='dev', version_url='http://localhost:8081/dev/cat/status', build_system_url=bs_url))
-        service.add_env(EnvConfig(env='prod', version_url='http://localhost:8081/prod/cat/status'))
-        self.add_to_services(service)
-
-        service = ServiceConfig('dog', GeneralConfig('dog-repo', True, 'dog/db/changelog.xml'))
-        bs_url = Constants.build_system_url('/job/dog/{}')
-        service.add_env(EnvConfig(env='dev', version_url='http://localhost:8081/dev/dog/status', build_system_url=bs_url))
-        service.add_env(EnvConfig(env='prod', version_url='http://localhost:8081/prod/dog/status'))
-        self.add_to_services(service)
-
-        service = ServiceConfig('dog-ui', GeneralConfig('dog-ui-repo'))
-        bs_url = Constants.build_system_url('/job/dog-ui/{}/')
-        service.add_env(EnvConfig(env='dev', version_url='http://localhost:8081/dev/dog-ui/version.json', build_system_url=bs_url))
-        service.add_env(EnvConfig(env='prod', version_url='http://localhost:8081/prod/dog-ui/version.json'))
-        self.add_to_services(service)
+        self.env_indexes = {env: index for index, env in enumerate(self.envs)}
+        self.env_tag_prefix = dict(definition['envTagPrefix'])
+        self.base_versions_urls = dict(definition.get('baseVersionsUrls', {}))
+
+        for order, service_definition in enumerate(definition['services'], start=1):
+            service = ServiceConfig(service_definition['name'],
+                                    GeneralConfig(service_definition['repo'],
+                                                  service_definition.get('hasDb', False),
+                                                  service_definition.get('changelogFile')))
+            for env, env_definition in service_definition['envs'].items():
+                bs_url = env_definition.get('buildSystemUrl', '')
+                service.add_env(EnvConfig(env=env,
+                                          version_url=env_definition['versionUrl'],
+                                          build_system_url=Constants.build_system_url(bs_url) if bs_url else ''))
+            service.order = order
+            self.services[service.name] = service
+
+        ordered = sorted(self.services.values(), key=lambda x: x.order)
+        self.app_names = [service.name for service in ordered]
+        self.app_names_with_db = [service.name for service in ordered if service.general_config.has_db]
+
+
+def load_services_definition(path):
+    with open(path, 'r') as file:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise RuntimeError('PyYAML is required to read {}'.format(path))
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+class ServicesData:
+
+    def __init__(self, path: str = None):
+        self.path = path or Constants.SERVICES_FILE
+        self.__lock = threading.Lock()
+        self.__mtime = os.stat(self.path).st_mtime
+        self.__checked_at = time.monotonic()
+        self.__registry = ServicesRegistry(load_services_definition(self.path))
+        self.__listeners = []
+
+    def add_listener(self, listener):
+        self.__listeners.append(listener)
+
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now - self.__checked_at < Constants.SERVICES_RELOAD_CHECK_INTERVAL:
+            return False
+
+        with self.__lock:
+            self.__checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime == self.__mtime:
+                    return False
+                registry = ServicesRegistry(load_services_definition(self.path))
+            except Exception as err:
+                # a broken edit, in syntax or in shape, must not take every report down with it
+                logger.error("Reloading %s failed, keeping the previous services: %s", self.path, err)
+                return False
+
+            self.__mtime = mtime
+            self.__registry = registry
+            logger.info("Reloaded %d services from %s", len(registry.services), self.path)
+
+        for listener in self.__listeners:
+            try:
+                listener()
+            except Exception:
+                logger.exception("Notifying about reloaded services failed")
+        return True
+
+    @property
+    def services(self):
+        return self.__registry.services
+
+    @property
+    def envs(self):
+        return self.__registry.envs
+
+    @property
+    def dev_envs(self):
+        return self.__registry.dev_envs
+
+    @property
+    def release_envs(self):
+        return self.__registry.release_envs
+
+    @property
+    def env_indexes(self):
+        return self.__registry.env_indexes
+
+    @property
+    def env_tag_prefix(self):
+        return self.__registry.env_tag_prefix
+
+    @property
+    def base_versions_urls(self):
+        return self.__registry.base_versions_urls
 
     def get_app_names(self):
-        return [service.name for service in sorted(self.services.values(), key=lambda x: x.order)]
+        self.reload_if_changed()
+        return self.__registry.app_names
 
     def get_app_names_with_db(self):
-        return [service.name for service in sorted(self.services.values(), key=lambda x: x.order) if service.general_config.has_db]
-
-    def add_to_services(self, service: ServiceConfig):
-        self.services[service.name] = service
-        self.__num__ += 1
-        service.order = self.__num__
+        self.reload_if_changed()
+        return self.__registry.app_names_with_db
 
     def get_base_branch(self, env: str, version: str = None):
         if env in self.dev_envs:
             return 'devel'
         branch = version.replace('.t', '')
         return '{}.0'.format(branch[:branch.rfind('.')])
-
@@ -1,84 +1,244 @@
 #!/usr/env python3
 
-import requests
 import xml.etree.ElementTree as ET
+import difflib
 import itertools
+import json
 import logging
+import posixpath
+import time
+from datetime import datetime
+from functools import lru_cache
 
+from . import bitbucket, metrics
 from .config import Constants
+from .fetcher import run_all
+from .model import (AppMigrationMatrix, AppMigrations, MigrationDiff, MigrationMatrixReport, MigrationMatrixRow,
+                    MigrationsReport)
+from .renderer import render
+from .versions import sort_versions
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(format=Constants.LOG_FORMAT)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(Constants.LOG_LEVEL)
 
 
-def __load_db_changelog(project, branch, changelog_file):
+def __src_url(project, commit_hash, path):
+    return '{}/repositories/{}/{}/src/{}/{}'.format(
+        Constants.BITBUCKET_API_URL, Constants.ATLASSIAN_ORG_NAME, project, commit_hash, path)
 
-    url = 'https://api.bitbucket.org/2.0/repositories/{}/{}/src/{}/{}'.format(
-        Constants.ATLASSIAN_ORG_NAME, project, branch, changelog_file)
-    logger.debug('URL to query:' + url)
-    resp = requests.get(url, auth=(Constants.BITBUCKET_USER, Constants.BITBUCKET_API_KEY))
 
-    return resp.text
+def __list_changelog_dir(project, commit_hash, path):
+    # a directory listing at a given commit never changes either
+    files = []
+    url = __src_url(project, commit_hash, path.rstrip('/') + '/')
+    while url:
+        page = json.loads(bitbucket.get_immutable_text(url))
+        files.extend(item['path'] for item in page['values'] if item['type'] == 'commit_file')
+        url = page.get('next')
+    return sorted(files)
 
 
-def __get_migrations(changelog):
+@lru_cache(maxsize=Constants.CHANGELOG_PARSE_CACHE_SIZE)
+def __parse_db_changelog(project, commit_hash, changelog_file, follow_includes):
+    def load(path):
+        url = __src_url(project, commit_hash, path)
+        logger.debug('URL to query: %s', url)
+        return bitbucket.get_immutable_text(url)
 
-    root = ET.fromstring(changelog)
-    migrations = []
+    def list_dir(path):
+        return __list_changelog_dir(project, commit_hash, path)
 
-    for item in root:
-        migrations.append(item.attrib['file'])
+    return tuple(__iter_migrations(changelog_file, load, list_dir, follow_includes))
 
-    return migrations
 
+metrics.register_lru_cache('parse_db_changelog', __parse_db_changelog)
 
-def __compare_migrations(project, release_branch, changelog_file):
-    devel_migrations = __get_migrations(__load_db_changelog(project, 'devel', changelog_file))
-    release_migrations = __get_migrations(__load_db_changelog(project, release_branch, changelog_file))
 
-    now_different = False
-    to_remove = set()
-    result = []
-    for devel, release in itertools.zip_longest(devel_migrations, release_migrations, fillvalue=''):
-        if devel != release or now_different:
-            now_different = True
-            result.append({'devel': devel, 'release': release, 'remove': devel in to_remove})
-
-            if release != '':
-                logger.debug("{} <====== {} [{}]".format(devel, release, devel in to_remove))
-                to_remove.add(release)
+def __load_db_changelog(project, branch, changelog_file):
+    # a changelog at a given commit never changes, so it is cached by commit hash rather than branch
+    commit_hash = bitbucket.get_commit_hash(project, branch)
+    return __parse_db_changelog(project, commit_hash, changelog_file, Constants.CHANGELOG_FOLLOW_INCLUDES)
+
+
+def __load_changelog_query(query):
+    return __load_db_changelog(*query)
+
+
+def __resolve(changelog_path, path, attrib):
+    if attrib.get('relativeToChangelogFile') == 'true':
+        return posixpath.normpath(posixpath.join(posixpath.dirname(changelog_path), path))
+    return path
+
+
+def __iter_entries(changelog):
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    depth = 0
+    root = None
+    for offset in range(0, len(changelog), Constants.CHANGELOG_PARSE_CHUNK):
+        parser.feed(changelog[offset:offset + Constants.CHANGELOG_PARSE_CHUNK])
+        for event, elem in parser.read_events():
+            if event == 'start':
+                depth += 1
+                if root is None:
+                    root = elem
+                elif depth == 2:
+                    yield elem.tag.rsplit('}', 1)[-1], dict(elem.attrib)
+            else:
+                depth -= 1
+                if depth == 1:
+                    # drop finished entries so memory stays flat regardless of changelog size
+                    root.clear()
+    parser.close()
+
+
+def __iter_migrations(changelog_path, load, list_dir=None, follow_includes=False):
+    for tag, attrib in __iter_entries(load(changelog_path)):
+        if tag == 'include':
+            path = __resolve(changelog_path, attrib['file'], attrib)
+            if follow_includes and path.endswith('.xml'):
+                yield from __iter_migrations(path, load, list_dir, follow_includes)
+            else:
+                yield path
+        elif tag == 'includeAll':
+            path = __resolve(changelog_path, attrib['path'], attrib)
+            if follow_includes and list_dir is not None:
+                for file in list_dir(path):
+                    if file.endswith('.xml'):
+                        yield from __iter_migrations(file, load, list_dir, follow_includes)
+                    else:
+                        yield file
             else:
-                logger.debug("{} [{}]".format(devel, devel in to_remove))
+                yield path
+
+
+def __compare_migrations(devel_migrations, release_migrations):
+    in_release = set(release_migrations)
+    matcher = difflib.SequenceMatcher(None, devel_migrations, release_migrations, autojunk=False)
+
+    result = []
+    for opcode, devel_start, devel_end, release_start, release_end in matcher.get_opcodes():
+        if opcode == 'equal':
+            continue
+        # entries present on both sides but not aligned by the diff were reordered
+        for devel, release in itertools.zip_longest(devel_migrations[devel_start:devel_end],
+                                                    release_migrations[release_start:release_end], fillvalue=''):
+            remove = devel != '' and devel in in_release
+            result.append(MigrationDiff(devel, release, remove))
+            logger.debug("%s <====== %s [%s]", devel, release, remove)
 
     return result
 
 
-def create_report(file, release_branch, services_data):
+def create_report(release_branch, services_data):
+    started = time.monotonic()
+    app_data = services_data.services
+    app_names = services_data.get_app_names_with_db()
+    app_results = {}
+
+    queries = {}
+    for app in app_names:
+        general_config = app_data[app].general_config
+        queries[app] = [(general_config.repo_name, branch, general_config.changelog_file)
+                        for branch in ('devel', release_branch)]
+
+    with metrics.stage('migrations', 'changelog_fetch'):
+        migrations = run_all(__load_changelog_query, [query for app in app_names for query in queries[app]],
+                             Constants.BITBUCKET_CONCURRENCY, Constants.CHANGELOG_DEADLINE)
+
+    for app in app_names:
+        devel_migrations, release_migrations = (migrations[query] for query in queries[app])
+        for result in (devel_migrations, release_migrations):
+            if isinstance(result, Exception):
+                logger.error("APP: %s err %s", app, result)
+                app_results[app] = AppMigrations(error=str(result))
+                break
+        else:
+            app_results[app] = AppMigrations(__compare_migrations(devel_migrations, release_migrations))
+
+    metrics.REPORT_BUILDS.labels('migrations', 'success').inc()
+    return MigrationsReport(release_branch=release_branch,
+                            generated_at=datetime.utcnow().isoformat(),
+                            apps=app_results,
+                            build_time=time.monotonic() - started)
+
+
+def release_branch(version):
+    if version.startswith(Constants.RELEASE_TAG_PREFIX):
+        return version
+    return Constants.RELEASE_TAG_PREFIX + version
+
+
+def deployed_release_branches(report, services_data):
+    branches = {services_data.get_base_branch(env, cell.deployment.build)
+                for env, env_report in report.envs.items() if env_report.release
+                for cell in env_report.cells.values()
+                if cell.deployment and cell.deployment.build.startswith(Constants.RELEASE_TAG_PREFIX)}
+    return list(reversed(sort_versions(branches)))
+
+
+def __matrix_statuses(devel_migrations, release_migrations):
+    in_devel = set(devel_migrations)
+    statuses = {}
+    for diff in __compare_migrations(devel_migrations, release_migrations):
+        if diff.devel:
+            statuses[diff.devel] = 'reordered' if diff.remove else 'missing'
+        if diff.release:
+            statuses.setdefault(diff.release, 'reordered' if diff.release in in_devel else 'release only')
+    return statuses
+
+
+def create_matrix_report(release_branches, services_data):
+    started = time.monotonic()
     app_data = services_data.services
     app_names = services_data.get_app_names_with_db()
+    branches = list(dict.fromkeys(release_branches))
     app_results = {}
 
+    # devel and every release branch are loaded and parsed once per app, however many branches are compared
+    queries = {}
+    for app in app_names:
+        general_config = app_data[app].general_config
+        queries[app] = {branch: (general_config.repo_name, branch, general_config.changelog_file)
+                        for branch in ['devel'] + branches}
+
+    with metrics.stage('migrations_matrix', 'changelog_fetch'):
+        migrations = run_all(__load_changelog_query, [query for app in app_names for query in queries[app].values()],
+                             Constants.BITBUCKET_CONCURRENCY, Constants.CHANGELOG_DEADLINE)
+
     for app in app_names:
-        changelog_file = services_data.services[app].general_config.changelog_file
-        result = __compare_migrations(app_data[app].general_config.repo_name, release_branch, changelog_file)
-        app_results[app] = result
-
-    with open(file, 'w+') as out:
-        out.write('<html><body>')
-        for app in app_names:
-            out.write('<h3>{}</h3>'.format(app))
-            out.write('<table width="100%">')
-            for result in app_results[app]:
-                l_color = 'white'
-                r_color = 'green'
-                if result['remove']:
-                    l_color = 'red'
-                if result['release'] == '':
-                    r_color = 'white'
-
-                out.write('<tr><td bgcolor="{}" width="50%">{}</td><td bgcolor="{}" width="50%">{}</td></tr>'
-                          .format(l_color, result['devel'], r_color, result['release']))
-            out.write('</table>')
-            out.write('<hr>')
-        out.write('</body></html>')
+        devel_migrations = migrations[queries[app]['devel']]
+        if isinstance(devel_migrations, Exception):
+            logger.error("APP: %s err %s", app, devel_migrations)
+            app_results[app] = AppMigrationMatrix(error=str(devel_migrations))
+            continue
+
+        statuses, errors = {}, {}
+        for branch in branches:
+            release_migrations = migrations[queries[app][branch]]
+            if isinstance(release_migrations, Exception):
+                logger.error("APP: %s BRANCH: %s err %s", app, branch, release_migrations)
+                errors[branch] = str(release_migrations)
+                continue
+            for migration, status in __matrix_statuses(devel_migrations, release_migrations).items():
+                statuses.setdefault(migration, {})[branch] = status
+
+        # devel order first, migrations only found on release branches after them
+        order = {migration: position for position, migration in enumerate(devel_migrations)}
+        rows = [MigrationMatrixRow(migration, statuses[migration])
+                for migration in sorted(statuses, key=lambda migration: order.get(migration, len(order)))]
+        app_results[app] = AppMigrationMatrix(rows, errors)
+
+    metrics.REPORT_BUILDS.labels('migrations_matrix', 'success').inc()
+    return MigrationMatrixReport(branches=branches,
+                                 generated_at=datetime.utcnow().isoformat(),
+                                 apps=app_results,
+                                 build_time=time.monotonic() - started)
+
+
+def render_report(report):
+    return render('migrations.html', report.build_time, report=report)
+
+
+def render_matrix_report(report):
+    return render('migrations_matrix.html', report.build_time, report=report)
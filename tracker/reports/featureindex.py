@@ -0,0 +1,136 @@
+#!/usr/env python3
+
+import logging
+import time
+
+from .commitgraph import known_commit_graph
+from .config import Constants
+from .fetcher import run_all
+from .jira_helper import get_jira_item_regex
+from .prindex import known_pull_requests, merged_pull_requests
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+def normalize_key(key):
+    key = key.strip()
+    if get_jira_item_regex().fullmatch(key):
+        return key.upper()
+    # anything else is looked up as a merge commit, as shown in the report
+    return key.lower()[:12]
+
+
+class FeatureDeployment:
+    __slots__ = ('env', 'app_name', 'build', 'pull_requests')
+
+    def __init__(self, env: str, app_name: str, build: str):
+        self.env = env
+        self.app_name = app_name
+        self.build = build
+        self.pull_requests = []
+
+    def to_dict(self):
+        return {
+            'env': self.env,
+            'app': self.app_name,
+            'build': self.build,
+            'pullRequests': [{'id': pr.get('id'),
+                              'title': pr['title'],
+                              'hash': pr['merge_commit']['hash'][:12],
+                              'link': pr['links']['html']['href']} for pr in self.pull_requests]
+        }
+
+
+class FeatureIndex:
+    __slots__ = ('generated_at', 'features')
+
+    def __init__(self, generated_at: str):
+        self.generated_at = generated_at
+        self.features = {}
+
+    def __contains__(self, key):
+        return normalize_key(key) in self.features
+
+    def add(self, keys, pr, env, app_name, build, deployed):
+        for key in keys:
+            deployments = self.features.setdefault(key, {})
+            if not deployed:
+                continue
+            deployment = deployments.get((env, app_name))
+            if deployment is None:
+                deployment = deployments[(env, app_name)] = FeatureDeployment(env, app_name, build)
+            deployment.pull_requests.append(pr)
+
+    def lookup(self, key):
+        deployments = self.features.get(normalize_key(key))
+        if deployments is None:
+            return None
+        return [deployment.to_dict() for deployment in deployments.values()]
+
+    def lookup_all(self, keys):
+        return {key: self.lookup(key) for key in keys}
+
+
+def deployed_commits(services_data, env, app_name, build, commit_id):
+    repo_name = services_data.services[app_name].general_config.repo_name
+    graph = known_commit_graph(repo_name)
+    is_ancestor = graph.reachability(commit_id[:12]) if graph is not None else None
+    if is_ancestor is not None:
+        return is_ancestor
+
+    # without a commit graph, merged PRs come newest first and everything from the deployed one on is deployed
+    positions = {}
+    for position, pr in enumerate(known_pull_requests(repo_name, services_data.get_base_branch(env, build))):
+        positions.setdefault(pr['merge_commit']['hash'][:12], position)
+    deployed_position = positions.get(commit_id[:12])
+
+    def is_deployed(other_id):
+        position = positions.get(other_id)
+        return deployed_position is not None and position is not None and position >= deployed_position
+
+    return is_deployed
+
+
+def __fetch_window(key):
+    repo_name, branch = key
+    return len(merged_pull_requests(repo_name, branch).fetch_window(Constants.FEATURE_INDEX_PAGES))
+
+
+def __deployed_cells(report, services_data):
+    for env, env_report in report.envs.items():
+        for app_name, cell in env_report.cells.items():
+            if cell.deployment is not None and app_name in services_data.services:
+                yield env, app_name, cell.deployment
+
+
+def create_index(report, services_data):
+    started = time.monotonic()
+    index = FeatureIndex(report.generated_at)
+    jira_regex = get_jira_item_regex()
+    title_keys = {}
+
+    # the report only pages in the newest PRs, the index covers the first FEATURE_INDEX_PAGES pages of every branch
+    branches = {(services_data.services[app_name].general_config.repo_name,
+                 services_data.get_base_branch(env, deployment.build))
+                for env, app_name, deployment in __deployed_cells(report, services_data)}
+    for (repo_name, branch), result in run_all(__fetch_window, branches, Constants.BITBUCKET_CONCURRENCY,
+                                               Constants.BITBUCKET_DEADLINE).items():
+        if isinstance(result, Exception):
+            logger.warning("Indexing only the known pull requests of %s/%s: %s", repo_name, branch, result)
+
+    for env, app_name, deployment in __deployed_cells(report, services_data):
+        repo_name = services_data.services[app_name].general_config.repo_name
+        branch = services_data.get_base_branch(env, deployment.build)
+        is_deployed = deployed_commits(services_data, env, app_name, deployment.build, deployment.commit_id)
+
+        for pr in known_pull_requests(repo_name, branch):
+            commit_id = pr['merge_commit']['hash'][:12]
+            title = pr['title']
+            if title not in title_keys:
+                title_keys[title] = {key.upper() for key in jira_regex.findall(title)}
+            index.add(title_keys[title] | {commit_id}, pr, env, app_name, deployment.build, is_deployed(commit_id))
+
+    logger.info("Indexed %d features in %.3fs", len(index.features), time.monotonic() - started)
+    return index
@@ -0,0 +1,193 @@
+#!/usr/env python3
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+from .config import Constants
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    pass
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    def __init__(self, host, since):
+        super().__init__('{} unavailable (since {:%Y-%m-%d %H:%M:%S} UTC)'.format(host, since))
+        self.host = host
+        self.since = since
+
+
+class CircuitBreaker:
+    def __init__(self, host):
+        self.host = host
+        self.failures = 0
+        self.since = None
+        self.probe_interval = Constants.CIRCUIT_PROBE_INTERVAL
+        self.probe_at = 0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def _open(self):
+        return self.failures >= Constants.CIRCUIT_FAILURE_THRESHOLD
+
+    def unavailable_since(self):
+        # only looks, a probe is granted by acquire()
+        with self.lock:
+            if not self._open() or (not self.probing and time.monotonic() >= self.probe_at):
+                return None
+            return self.since
+
+    def acquire(self):
+        with self.lock:
+            if not self._open():
+                return
+            # let a single request through once the probe interval has passed
+            if not self.probing and time.monotonic() >= self.probe_at:
+                self.probing = True
+                return
+            since = self.since
+        raise CircuitOpen(self.host, since)
+
+    def record_success(self):
+        with self.lock:
+            if self._open():
+                logger.info("%s is back after being unavailable since %s", self.host, self.since)
+                metrics.UPSTREAM_CIRCUIT_OPEN.labels(self.host).set(0)
+            self.failures = 0
+            self.since = None
+            self.probing = False
+            self.probe_interval = Constants.CIRCUIT_PROBE_INTERVAL
+
+    def record_failure(self):
+        with self.lock:
+            was_open = self._open()
+            self.failures += 1
+            if self.since is None:
+                self.since = datetime.utcnow()
+            if not self._open():
+                return
+            if self.probing:
+                self.probe_interval = min(2 * self.probe_interval, Constants.CIRCUIT_MAX_PROBE_INTERVAL)
+                self.probing = False
+            self.probe_at = time.monotonic() + self.probe_interval
+            if not was_open:
+                logger.warning("%s unavailable since %s, failing fast", self.host, self.since)
+                metrics.UPSTREAM_CIRCUIT_OPEN.labels(self.host).set(1)
+
+
+def __create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=Constants.STATUS_FETCH_CONCURRENCY,
+                          pool_maxsize=Constants.STATUS_FETCH_PER_HOST)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+__session = __create_session()
+__host_limits = {}
+__circuit_breakers = {}
+__host_limits_lock = threading.Lock()
+
+
+def __host_limit(host):
+    with __host_limits_lock:
+        if host not in __host_limits:
+            __host_limits[host] = threading.BoundedSemaphore(Constants.STATUS_FETCH_PER_HOST)
+        return __host_limits[host]
+
+
+def __circuit_breaker(host):
+    with __host_limits_lock:
+        if host not in __circuit_breakers:
+            __circuit_breakers[host] = CircuitBreaker(host)
+        return __circuit_breakers[host]
+
+
+def __is_outage(err):
+    # any HTTP response, even a 5xx from one broken app, proves the host is up for the other apps behind it
+    return isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def get_json(url, timeout=Constants.STATUS_FETCH_TIMEOUT):
+    host = urlsplit(url).netloc
+    breaker = __circuit_breaker(host)
+    # fail fast instead of queueing behind requests that are still waiting on a dead host
+    since = breaker.unavailable_since()
+    if since is not None:
+        raise CircuitOpen(host, since)
+
+    with __host_limit(host):
+        breaker.acquire()
+        try:
+            with metrics.upstream(url):
+                r = __session.get(url, timeout=(min(Constants.STATUS_FETCH_CONNECT_TIMEOUT, timeout), timeout))
+                r.raise_for_status()
+        except requests.exceptions.RequestException as err:
+            if __is_outage(err):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+    return r.json()
+
+
+def __get_json_before(url, deadline_at):
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded('deadline exceeded before fetching {}'.format(url))
+    return get_json(url, timeout=min(Constants.STATUS_FETCH_TIMEOUT, remaining))
+
+
+def run_all(fn, keys, max_workers, deadline):
+    keys = list(dict.fromkeys(keys))
+    results = {}
+    if not keys:
+        return results
+
+    started = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(keys)))
+    futures = {executor.submit(fn, key): key for key in keys}
+    done, not_done = wait(futures, timeout=deadline)
+
+    for future in done:
+        key = futures[future]
+        try:
+            results[key] = future.result()
+        except Exception as err:
+            results[key] = err
+
+    for future in not_done:
+        key = futures[future]
+        future.cancel()
+        results[key] = DeadlineExceeded('deadline of {}s exceeded for {}'.format(deadline, key))
+
+    executor.shutdown(wait=False)
+    logger.debug('Ran %s for %d keys in %.3fs (%d timed out)', fn.__name__, len(keys), time.monotonic() - started,
+                 len(not_done))
+    return results
+
+
+def fetch_json_all(urls, max_workers=Constants.STATUS_FETCH_CONCURRENCY, deadline=Constants.STATUS_FETCH_DEADLINE):
+    deadline_at = time.monotonic() + deadline
+
+    def fetch_json(url):
+        return __get_json_before(url, deadline_at)
+
+    return run_all(fetch_json, urls, max_workers, deadline)
@@ -0,0 +1,142 @@
+#!/usr/env python3
+
+import logging
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from datetime import datetime
+
+from .config import Constants
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+def timestamp(value):
+    try:
+        parsed = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    except (TypeError, ValueError):
+        return None
+    return parsed.timestamp()
+
+
+def isoformat(value):
+    return datetime.utcfromtimestamp(value).isoformat(timespec='seconds')
+
+
+def row_to_dict(row):
+    env, app_name, build, commit_id, commit_time, observed_at = row
+    return {
+        'env': env,
+        'app': app_name,
+        'build': build,
+        'commitId': commit_id,
+        'commitTime': commit_time,
+        'observedAt': isoformat(observed_at)
+    }
+
+
+class DeploymentHistory:
+    def __init__(self, path=Constants.HISTORY_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.executescript(
+            'CREATE TABLE IF NOT EXISTS deployments ('
+            'env TEXT NOT NULL, app TEXT NOT NULL, build TEXT NOT NULL, commit_id TEXT NOT NULL, '
+            'commit_time TEXT, commit_at REAL, observed_at REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS deployments_env_app_observed ON deployments (env, app, observed_at);'
+            'CREATE INDEX IF NOT EXISTS deployments_app_observed ON deployments (app, observed_at);'
+            'CREATE INDEX IF NOT EXISTS deployments_observed ON deployments (observed_at);')
+        self.__db.commit()
+        # only changes are written, so polls of an unchanged fleet never reach the database
+        self.__last_seen = {(env, app_name): (build, commit_id) for env, app_name, build, commit_id, _ in
+                            self.__db.execute('SELECT env, app, build, commit_id, MAX(observed_at) '
+                                              'FROM deployments GROUP BY env, app')}
+
+    def record(self, observations, observed_at=None):
+        observed_at = observed_at or time.time()
+        with self.__lock:
+            rows = []
+            for env, app_name, build, commit_id, commit_time in observations:
+                if self.__last_seen.get((env, app_name)) == (build, commit_id):
+                    continue
+                self.__last_seen[(env, app_name)] = (build, commit_id)
+                rows.append((env, app_name, build, commit_id, commit_time, timestamp(commit_time), observed_at))
+            if rows:
+                self.__db.executemany('INSERT INTO deployments (env, app, build, commit_id, commit_time, commit_at, '
+                                      'observed_at) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                self.__db.commit()
+        if rows:
+            logger.info("Recorded %d deployment changes", len(rows))
+        return len(rows)
+
+    def record_report(self, report, observed_at=None):
+        return self.record(((env, app_name, cell.deployment.build, cell.deployment.commit_id,
+                             cell.deployment.commit_time)
+                            for env, env_report in report.envs.items()
+                            for app_name, cell in env_report.cells.items()
+                            if cell.deployment is not None and cell.deployment.build != 'unknown'), observed_at)
+
+    def __query(self, sql, parameters=()):
+        with self.__lock:
+            return self.__db.execute(sql, parameters).fetchall()
+
+    def snapshot(self, at):
+        # SQLite fills the bare columns from the row holding MAX(observed_at)
+        rows = self.__query('SELECT env, app, build, commit_id, commit_time, MAX(observed_at) FROM deployments '
+                            'WHERE observed_at <= ? GROUP BY env, app', (at,))
+        envs = {}
+        for row in rows:
+            envs.setdefault(row[0], {})[row[1]] = row_to_dict(row)
+        return envs
+
+    def changes(self, env=None, app_name=None, since=None, until=None, limit=1000):
+        conditions, parameters = ['observed_at >= ?', 'observed_at <= ?'], [since or 0, until or time.time()]
+        if env:
+            conditions.append('env = ?')
+            parameters.append(env)
+        if app_name:
+            conditions.append('app = ?')
+            parameters.append(app_name)
+        rows = self.__query('SELECT env, app, build, commit_id, commit_time, observed_at FROM deployments '
+                            'WHERE {} ORDER BY observed_at DESC LIMIT ?'.format(' AND '.join(conditions)),
+                            parameters + [limit])
+        return [row_to_dict(row) for row in rows]
+
+    def lead_times(self, env, since=None, until=None):
+        rows = self.__query('SELECT app, observed_at - commit_at FROM deployments '
+                            'WHERE env = ? AND observed_at >= ? AND observed_at <= ? AND commit_at IS NOT NULL',
+                            (env, since or 0, until or time.time()))
+        by_app = {}
+        for app_name, lead_time in rows:
+            by_app.setdefault(app_name, []).append(max(lead_time, 0))
+
+        stats = {}
+        for app_name, lead_times in by_app.items():
+            lead_times.sort()
+            stats[app_name] = {
+                'deployments': len(lead_times),
+                'mean': statistics.mean(lead_times),
+                'median': statistics.median(lead_times),
+                'p90': lead_times[min(len(lead_times) - 1, int(0.9 * len(lead_times)))]
+            }
+        return stats
+
+    def first_deployed(self, app_name, contains, merged_at=None, since=None):
+        # merged_at is only an estimate, deployments before it are ruled out by contains instead of the query
+        rows = self.__query('SELECT env, app, build, commit_id, commit_time, observed_at FROM deployments '
+                            'WHERE app = ? AND observed_at >= ? ORDER BY observed_at', (app_name, since or 0))
+        first = {}
+        for row in rows:
+            env, _, build, commit_id, _, observed_at = row
+            if env not in first and contains(env, build, commit_id):
+                first[env] = row_to_dict(row)
+                first[env]['leadTime'] = max(observed_at - merged_at, 0) if merged_at else None
+        return first
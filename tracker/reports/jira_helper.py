@@ -1,17 +1,29 @@
 #!/usr/env python3
 
 import re
+from functools import lru_cache
+from . import metrics
 from .config import Constants
 
-__jira_regex = re.compile('[A-Za-z]{2,}-\d+')
+__jira_regex = re.compile(r'[A-Za-z]{2,}-\d+')
 
 
+@lru_cache(maxsize=Constants.JIRA_LINK_CACHE_SIZE)
 def create_jira_link(org_name, description):
-    jiras = __jira_regex.findall(description)
-    result = description
-    for jira in jiras:
-        result = result.replace(jira, '<a href="{}/{}">{}</a>'.format(Constants.JIRA_URL, org_name, jira, jira))
-    return result
+    base_url = Constants.JIRA_URL.format(org_name)
+
+    def link(match):
+        return '<a href="{}/{}">{}</a>'.format(base_url, match.group(0), match.group(0))
+
+    return __jira_regex.sub(link, description)
+
+
+metrics.register_lru_cache('create_jira_link', create_jira_link)
+
+
+def create_jira_links(org_name, descriptions):
+    links = {description: create_jira_link(org_name, description) for description in set(descriptions)}
+    return [links[description] for description in descriptions]
 
 
 def get_jira_item_regex():
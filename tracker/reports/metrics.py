@@ -0,0 +1,66 @@
+#!/usr/env python3
+
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily
+
+REPORT_STAGE_SECONDS = Histogram('tracker_report_stage_seconds', 'Time spent in each report build stage',
+                                 ['report', 'stage'])
+REPORT_BUILDS = Counter('tracker_report_builds_total', 'Report builds', ['report', 'outcome'])
+UPSTREAM_SECONDS = Histogram('tracker_upstream_request_seconds', 'Upstream request latency', ['host'])
+UPSTREAM_ERRORS = Counter('tracker_upstream_errors_total', 'Failed upstream requests', ['host'])
+UPSTREAM_CIRCUIT_OPEN = Gauge('tracker_upstream_circuit_open', 'Whether requests to a host fail fast', ['host'])
+CACHE_REQUESTS = Counter('tracker_cache_requests_total', 'Cache lookups by result', ['cache', 'result'])
+
+
+class LruCacheCollector:
+    def __init__(self):
+        self.caches = {}
+
+    def register(self, name, cached_function):
+        self.caches[name] = cached_function
+
+    def collect(self):
+        requests = CounterMetricFamily('tracker_memo_requests', 'Memoised function lookups by result',
+                                       labels=['cache', 'result'])
+        for name, cached_function in self.caches.items():
+            info = cached_function.cache_info()
+            requests.add_metric([name, 'hit'], info.hits)
+            requests.add_metric([name, 'miss'], info.misses)
+        yield requests
+
+
+__lru_caches = LruCacheCollector()
+REGISTRY.register(__lru_caches)
+
+
+def register_lru_cache(name, cached_function):
+    __lru_caches.register(name, cached_function)
+
+
+def stage(report, name):
+    return REPORT_STAGE_SECONDS.labels(report, name).time()
+
+
+@contextmanager
+def upstream(url):
+    host = urlsplit(url).netloc
+    started = time.monotonic()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.labels(host).inc()
+        raise
+    finally:
+        UPSTREAM_SECONDS.labels(host).observe(time.monotonic() - started)
+
+
+def cache_lookup(cache, result):
+    CACHE_REQUESTS.labels(cache, result).inc()
+
+
+def exposition():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,200 @@
+#!/usr/env python3
+
+from .versions import max_version
+
+
+class PullRequest:
+    __slots__ = ('title', 'hash', 'author', 'link', 'versions', 'deployed')
+
+    def __init__(self, title: str, hash: str, author: str, link: str, versions: tuple = (), deployed: bool = False):
+        self.title = title
+        self.hash = hash
+        self.author = author
+        self.link = link
+        self.versions = versions
+        self.deployed = deployed
+
+    @property
+    def colour(self):
+        return 'green' if self.deployed else 'lightgray'
+
+    def to_dict(self):
+        return {
+            'title': self.title,
+            'hash': self.hash,
+            'author': self.author,
+            'link': self.link,
+            'versions': list(self.versions),
+            'deployed': self.deployed
+        }
+
+
+class Deployment:
+    __slots__ = ('build', 'commit_id', 'commit_time', 'found', 'base_version')
+
+    def __init__(self, build: str = 'unknown', commit_id: str = 'unknown', commit_time: str = 'unknown',
+                 found: bool = False, base_version: str = None):
+        self.build = build
+        self.commit_id = commit_id
+        self.commit_time = commit_time
+        self.found = found
+        self.base_version = base_version
+
+    def to_dict(self):
+        return {
+            'build': self.build,
+            'commitId': self.commit_id,
+            'commitTime': self.commit_time,
+            'found': self.found,
+            'base': self.base_version
+        }
+
+
+class AppCell:
+    __slots__ = ('deployment', 'pull_requests', 'error', 'unavailable_since')
+
+    def __init__(self, deployment: Deployment = None, pull_requests: list = None, error: str = None,
+                 unavailable_since: str = None):
+        self.deployment = deployment
+        self.pull_requests = pull_requests if pull_requests is not None else []
+        self.error = error
+        self.unavailable_since = unavailable_since
+
+    def to_dict(self):
+        return {
+            'deployment': self.deployment.to_dict() if self.deployment else None,
+            'pullRequests': [pr.to_dict() for pr in self.pull_requests],
+            'error': self.error,
+            'unavailableSince': self.unavailable_since
+        }
+
+
+class EnvReport:
+    __slots__ = ('env', 'release', 'cells')
+
+    def __init__(self, env: str, release: bool, cells: dict = None):
+        self.env = env
+        self.release = release
+        self.cells = cells if cells is not None else {}
+
+    @property
+    def highest_version(self):
+        return max_version(cell.deployment.build for cell in self.cells.values() if cell.deployment)
+
+    def to_dict(self):
+        return {
+            'env': self.env,
+            'release': self.release,
+            'highestVersion': self.highest_version if self.release else None,
+            'apps': {app_name: cell.to_dict() for app_name, cell in self.cells.items()}
+        }
+
+
+class VersionsReport:
+    __slots__ = ('generated_at', 'build_time', 'app_names', 'envs')
+
+    def __init__(self, generated_at: str, app_names: list, envs: dict, build_time: float = 0):
+        self.generated_at = generated_at
+        self.build_time = build_time
+        self.app_names = app_names
+        self.envs = envs
+
+    def merge(self, other):
+        envs = {}
+        for env, env_report in self.envs.items():
+            if env in other.envs:
+                cells = dict(env_report.cells)
+                cells.update(other.envs[env].cells)
+                env_report = EnvReport(env, env_report.release, cells)
+            envs[env] = env_report
+        return VersionsReport(other.generated_at, self.app_names, envs, self.build_time)
+
+    def to_dict(self):
+        return {
+            'generatedAt': self.generated_at,
+            'buildTime': self.build_time,
+            'apps': self.app_names,
+            'envs': [env_report.to_dict() for env_report in self.envs.values()]
+        }
+
+
+class MigrationDiff:
+    __slots__ = ('devel', 'release', 'remove')
+
+    def __init__(self, devel: str, release: str, remove: bool = False):
+        self.devel = devel
+        self.release = release
+        self.remove = remove
+
+    def to_dict(self):
+        return {'devel': self.devel, 'release': self.release, 'remove': self.remove}
+
+
+class AppMigrations:
+    __slots__ = ('diffs', 'error')
+
+    def __init__(self, diffs: list = None, error: str = None):
+        self.diffs = diffs if diffs is not None else []
+        self.error = error
+
+    def to_dict(self):
+        return {'diffs': [diff.to_dict() for diff in self.diffs], 'error': self.error}
+
+
+class MigrationMatrixRow:
+    __slots__ = ('migration', 'statuses')
+
+    def __init__(self, migration: str, statuses: dict):
+        self.migration = migration
+        self.statuses = statuses
+
+    def to_dict(self):
+        return {'migration': self.migration, 'statuses': self.statuses}
+
+
+class AppMigrationMatrix:
+    __slots__ = ('rows', 'errors', 'error')
+
+    def __init__(self, rows: list = None, errors: dict = None, error: str = None):
+        self.rows = rows if rows is not None else []
+        self.errors = errors if errors is not None else {}
+        self.error = error
+
+    def to_dict(self):
+        return {'rows': [row.to_dict() for row in self.rows], 'errors': self.errors, 'error': self.error}
+
+
+class MigrationMatrixReport:
+    __slots__ = ('branches', 'generated_at', 'build_time', 'apps')
+
+    def __init__(self, branches: list, generated_at: str, apps: dict, build_time: float = 0):
+        self.branches = branches
+        self.generated_at = generated_at
+        self.build_time = build_time
+        self.apps = apps
+
+    def to_dict(self):
+        return {
+            'branches': self.branches,
+            'generatedAt': self.generated_at,
+            'buildTime': self.build_time,
+            'apps': {app_name: matrix.to_dict() for app_name, matrix in self.apps.items()}
+        }
+
+
+class MigrationsReport:
+    __slots__ = ('release_branch', 'generated_at', 'build_time', 'apps')
+
+    def __init__(self, release_branch: str, generated_at: str, apps: dict, build_time: float = 0):
+        self.release_branch = release_branch
+        self.generated_at = generated_at
+        self.build_time = build_time
+        self.apps = apps
+
+    def to_dict(self):
+        return {
+            'releaseBranch': self.release_branch,
+            'generatedAt': self.generated_at,
+            'buildTime': self.build_time,
+            'apps': {app_name: migrations.to_dict() for app_name, migrations in self.apps.items()}
+        }
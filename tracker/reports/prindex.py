@@ -0,0 +1,114 @@
+#!/usr/env python3
+
+import logging
+import threading
+from urllib.parse import quote
+
+from . import bitbucket
+from .config import Constants
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+class MergedPullRequests:
+    def __init__(self, repo_name: str, branch: str):
+        self.repo_name = repo_name
+        self.branch = branch
+        self.prs = []
+        self.ids = set()
+        self.synced_until = None
+        self.older_url = self.__url()
+        self.pages_fetched = 0
+        self.lock = threading.Lock()
+
+    def __url(self, since=None):
+        query = 'state="MERGED" AND destination.branch.name="{}"'.format(self.branch)
+        if since:
+            query += ' AND updated_on > {}'.format(since)
+        # timestamps carry a '+' offset that would otherwise be decoded as a space
+        return '{}/repositories/{}/{}/pullrequests?q={}&sort=-updated_on&pagelen={}'.format(
+            Constants.BITBUCKET_API_URL, Constants.ATLASSIAN_ORG_NAME, self.repo_name, quote(query),
+            Constants.PR_PAGELEN)
+
+    def __track(self, pr):
+        updated_on = pr.get('updated_on')
+        if updated_on and (self.synced_until is None or updated_on > self.synced_until):
+            self.synced_until = updated_on
+
+    def sync(self, revalidate=False):
+        with self.lock:
+            if self.synced_until is None:
+                return
+            new_prs = list(bitbucket.iter_values(self.__url(self.synced_until), revalidate=revalidate))
+            if not new_prs:
+                return
+
+            # the list is kept in merge order: a comment or approval bumps updated_on of an old PR, which is
+            # only refreshed where it is, PRs never seen before are the new merges and go to the front
+            updated = {pr['id']: pr for pr in new_prs if pr['id'] in self.ids}
+            merged = [pr for pr in new_prs if pr['id'] not in self.ids]
+            self.prs = merged + [updated.get(pr['id'], pr) for pr in self.prs]
+            self.ids.update(pr['id'] for pr in merged)
+            for pr in new_prs:
+                self.__track(pr)
+            logger.info("%s/%s: synced %d merged and %d updated pull requests", self.repo_name, self.branch,
+                        len(merged), len(updated))
+
+    def __fetch_older(self):
+        with self.lock:
+            if not self.older_url or self.pages_fetched >= Constants.PR_MAX_PAGES:
+                return []
+            page = bitbucket.get_json(self.older_url)
+            self.pages_fetched += 1
+            self.older_url = page.get('next')
+
+            older = [pr for pr in page.get('values', []) if pr['id'] not in self.ids]
+            self.prs.extend(older)
+            self.ids.update(pr['id'] for pr in older)
+            for pr in older:
+                self.__track(pr)
+            return older
+
+    def fetch_window(self, pages):
+        # reads older pages until the first `pages` pages are known
+        while self.older_url and self.pages_fetched < min(pages, Constants.PR_MAX_PAGES):
+            self.__fetch_older()
+        return self.known()
+
+    def known(self):
+        with self.lock:
+            return list(self.prs)
+
+    def __iter__(self):
+        with self.lock:
+            known = list(self.prs)
+        yield from known
+
+        while True:
+            older = self.__fetch_older()
+            if not older:
+                if not self.older_url or self.pages_fetched >= Constants.PR_MAX_PAGES:
+                    return
+                continue
+            yield from older
+
+
+__indexes = {}
+__indexes_lock = threading.Lock()
+
+
+def known_pull_requests(repo_name, branch):
+    # what has already been fetched, never goes to Bitbucket
+    with __indexes_lock:
+        index = __indexes.get((repo_name, branch))
+    return index.known() if index else []
+
+
+def merged_pull_requests(repo_name, branch):
+    key = (repo_name, branch)
+    with __indexes_lock:
+        if key not in __indexes:
+            __indexes[key] = MergedPullRequests(repo_name, branch)
+        return __indexes[key]
@@ -1,274 +1,291 @@
 #!/usr/env python3
 
 import logging
-import sys
-import requests
+import time
 from datetime import datetime
-from cachetools import cached, TTLCache
-
-from .tools import sort_versions
+from itertools import islice
+
+from . import commitgraph, metrics
+from .fetcher import CircuitOpen, fetch_json_all, run_all
+from .renderer import render, template_module
+from .prindex import merged_pull_requests
+from .tagindex import tag_index
+from .model import AppCell, Deployment, EnvReport, PullRequest, VersionsReport
 from .jira_helper import create_jira_link
 from .config import Constants
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(format=Constants.LOG_FORMAT)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(Constants.LOG_LEVEL)
 
 
-def __get_base_versions_for_releases(services_data):
+def __get_base_versions_for_releases(services_data, base_versions_urls, fetched):
     response = {}
-    for env, url in services_data.base_versions_urls.items():
-        try:
-            r = requests.get(url, timeout=5)
-            r.raise_for_status()
-            response[env] = r.json()
-
-        except requests.exceptions.RequestException as err:
-            logger.exception(f"ENV: {env}")
-            logger.exception(f"err {err}")
+    for env, url in base_versions_urls.items():
+        result = fetched[url]
+        if isinstance(result, Exception):
+            logger.error("Base versions unavailable for ENV: %s, err %s", env, result)
 
             response[env] = {app: 'unknown' for app in services_data.services.keys()}
+        else:
+            response[env] = result
 
     return response
 
 
-@cached(cache=TTLCache(maxsize=1024, ttl=300))
-def __get_prs(url):
-    logger.info("Getting prs for: {}".format(url))
-    r = requests.get(url, auth=(Constants.BITBUCKET_USER, Constants.BITBUCKET_API_KEY))
-    return r.json()
+def __get_tags(repo_name, tag_prefix, revalidate):
+    tags = tag_index(repo_name, tag_prefix)
+    tags.refresh(revalidate)
+    return tags
+
+
+def __get_merged_prs(repo_name, branch, revalidate):
+    pull_requests = merged_pull_requests(repo_name, branch)
+    pull_requests.sync(revalidate)
+    next(iter(pull_requests), None)
+    return pull_requests
+
+
+def __run_query(query, revalidate=False):
+    kind, repo_name, ref = query
+    if kind == 'prs':
+        with metrics.stage('service_versions', 'pr_fetch'):
+            return __get_merged_prs(repo_name, ref, revalidate)
+    if kind == 'graph':
+        with metrics.stage('service_versions', 'graph_sync'):
+            return commitgraph.synced_commit_graph(repo_name, ref)
+    with metrics.stage('service_versions', 'tag_fetch'):
+        return __get_tags(repo_name, ref, revalidate)
+
+
+def __query_result(results, query):
+    result = results[query]
+    if isinstance(result, Exception):
+        raise result
+    return result
 
 
-@cached(cache=TTLCache(maxsize=1024, ttl=300))
-def __get_tags(url):
-    logger.info("Getting tags for: {}".format(url))
-    r = requests.get(url, auth=(Constants.BITBUCKET_USER, Constants.BITBUCKET_API_KEY))
-    return r.json()
+def __reachability(results, query, commit_id):
+    if query is None:
+        return None
+    graph = results[query]
+    if isinstance(graph, Exception):
+        logger.warning("Commit graph of %s unavailable, falling back to the PR order: %s", query[1], graph)
+        return None
+    return graph.reachability(commit_id[:12])
 
 
-def create_td_content(pr_data, env, service):
+def __pull_request(v, tags, deployed):
+    hash = v['merge_commit']['hash']
+    return PullRequest(title=v['title'],
+                       hash=hash,
+                       author=v['author']['display_name'],
+                       link=v['links']['html']['href'],
+                       versions=tags.get(hash),
+                       deployed=deployed)
+
+
+def create_td_content(pr, env, service):
     def build_for_tag(tag):
         return tag[len(Constants.DEV_TAG_PREFIX):]
 
     jenkins_url = service.env_configs[env].build_system_url
 
-    tags = pr_data['version'].split(',')
-    tags_build_urls = {tag: jenkins_url.format(build_for_tag(tag)) for tag in tags}
-
     builds = ''
-    for tag, jenkins_url in tags_build_urls.items():
-        builds += ' <a href="{}">{}</a>'.format(jenkins_url, tag)
+    for tag in pr.versions:
+        builds += ' <a href="{}">{}</a>'.format(jenkins_url.format(build_for_tag(tag)), tag)
 
     content = '{} +   <a href="{}"> {} </a> ({}) [{}]'.format(
-        create_jira_link(Constants.ATLASSIAN_ORG_NAME, pr_data['title']),
-        pr_data['pr_link'],
-        pr_data['hash'],
-        pr_data['author'],
-        builds,
-        pr_data['version']
+        create_jira_link(Constants.ATLASSIAN_ORG_NAME, pr.title),
+        pr.link,
+        pr.hash,
+        pr.author,
+        builds
     )
     return content
 
 
-def create_td_content_release(pr_data):
-    versions = pr_data['version']
-    if pr_data['version'] != '':
-        versions = sort_versions(versions.split(','))
-
+def create_td_content_release(pr):
     content = '{} +   <a href="{}"> {} </a> ({}) {}'.format(
-        create_jira_link(Constants.ATLASSIAN_ORG_NAME, pr_data['title']),
-        pr_data['pr_link'],
-        pr_data['hash'],
-        pr_data['author'],
-        versions
+        create_jira_link(Constants.ATLASSIAN_ORG_NAME, pr.title),
+        pr.link,
+        pr.hash,
+        pr.author,
+        ', '.join(pr.versions)
     )
     return content
 
 
-def create_report(file, services_data):
-    env_app_data = {}
-    env_versions_deployed = {env: [] for env in services_data.envs}
-    app_names = services_data.get_app_names()
+def create_report(services_data, apps=None, envs=None, statuses=None):
+    started = time.monotonic()
+    app_names = [app_name for app_name in services_data.get_app_names() if apps is None or app_name in apps]
+    env_names = [env for env in services_data.envs if envs is None or env in envs]
     app_data = services_data.services
-
-    for env in services_data.envs:
-        logger.info('===================ENV=' + env + '========================')
-        env_app_data[env] = {}
+    env_reports = {env: EnvReport(env, env in services_data.release_envs) for env in env_names}
+
+    statuses = statuses or {}
+    status_urls = [app_data[app_name].get_version_url(env) for env in env_names for app_name in app_names
+                   if (env, app_name) not in statuses]
+    base_versions_urls = {env: url for env, url in services_data.base_versions_urls.items() if env in env_reports}
+    with metrics.stage('service_versions', 'status_fetch'):
+        fetched = fetch_json_all(status_urls + list(base_versions_urls.values()))
+    base_versions_for_envs = __get_base_versions_for_releases(services_data, base_versions_urls, fetched)
+
+    for env in env_names:
+        logger.debug('===================ENV=%s========================', env)
         for app_name in app_names:
 
             final_address = app_data[app_name].get_version_url(env)
 
-            prs = {
-                'appBuild': 'unknown',
-                'gitCommitId': 'unknownunknownunknown',
-                'gitCommitTime': 'unknown'
-            }
-
-            try:
-                r = requests.get(final_address, timeout=5)
-                r.raise_for_status()
-                prs = r.json()
-            except requests.exceptions.RequestException as err:
-                logger.exception(f"ENV: {env} APP: {app_name}")
-                logger.exception(f"err {err}")
+            prs = statuses[(env, app_name)] if (env, app_name) in statuses else fetched[final_address]
+            if isinstance(prs, CircuitOpen):
+                logger.debug("Skipped ENV: %s APP: %s, %s", env, app_name, prs)
+                env_reports[env].cells[app_name] = AppCell(error=str(prs),
+                                                           unavailable_since=prs.since.isoformat(timespec='seconds'))
+                continue
+            if isinstance(prs, Exception):
+                logger.error("Status unavailable for ENV: %s APP: %s, err %s", env, app_name, prs)
+                env_reports[env].cells[app_name] = AppCell(error='status unavailable: {}'.format(prs))
                 continue
 
-            logger.debug("PRS: {}".format(prs))
+            logger.debug("PRS: %s", prs)
 
             # assign default
-            env_app_data[env][app_name] = {
-                "build": "unknown",
-                "commitId": "unknown",
-                "found": False,
-                "commitTime": "unknown"
-            }
+            deployment = Deployment()
 
             try:
-                build = prs['appBuild']
-                env_versions_deployed[env].append(build)
+                deployment = Deployment(build=prs['appBuild'],
+                                        commit_id=prs['gitCommitId'][:12],
+                                        commit_time=prs['gitCommitTime'])
 
-                commit_id = prs['gitCommitId'][:12]
-                commit_time = prs['gitCommitTime']
+                logger.debug("%s: build=%s, commit=%s", final_address, deployment.build, deployment.commit_id)
 
-                env_app_data[env][app_name] = {
-                    'build': build,
-                    'commitId': commit_id,
-                    'found': False,
-                    'commitTime': commit_time
-                }
+            except KeyError:
+                logger.exception("Malformed status for ENV: %s, APP: %s", env, app_name)
 
-                logger.info(f"{final_address}: build={build}, commit={commit_id}")
+            if env in base_versions_for_envs:
+                deployment.base_version = base_versions_for_envs[env].get(app_name, 'unknown')
+            env_reports[env].cells[app_name] = AppCell(deployment)
 
-            except KeyError as err:
-                logger.exception(f"ENV: {env}, APP: {app_name}")
-                logger.exception(f"err {err}")
+    # plan the distinct Bitbucket queries first, envs of one app often share a repo/branch or tag prefix
+    queries = {}
+    for app_name in app_names:
+        repo_app_name = app_data[app_name].general_config.repo_name
+        for env in env_names:
+            deployment = env_reports[env].cells[app_name].deployment
+            if deployment is None:
+                continue
+            branch = services_data.get_base_branch(env, deployment.build)
+            queries[(app_name, env)] = (('prs', repo_app_name, branch),
+                                        ('tags', repo_app_name, services_data.env_tag_prefix[env]),
+                                        ('graph', repo_app_name, branch) if commitgraph.enabled() else None)
 
-            logging.debug(env_app_data[env][app_name])
+    # partial refreshes come from deploy hooks and viewers, the newest merges must not be served from the cache
+    revalidate = apps is not None or envs is not None or bool(statuses)
 
-    prs_data = {}
-    tags_for_commits = {}
-    for app_name in app_names:
-        env_prs = {}
-        prs_data[app_name] = {}
+    def run_query(query):
+        return __run_query(query, revalidate)
 
-        repo_app_name = app_data[app_name].general_config.repo_name
-        for env in services_data.envs:
-            prs_data[app_name][env] = []
+    results = run_all(run_query, [query for cell in queries.values() for query in cell if query],
+                      Constants.BITBUCKET_CONCURRENCY, Constants.BITBUCKET_DEADLINE)
 
-            try:
-                branch = services_data.get_base_branch(env, env_app_data[env][app_name]['build'])
-                prs_query = 'state="MERGED" AND destination.branch.name="{}"'.format(branch)
-                prs = __get_prs('{}/repositories/{}/{}/pullrequests?q={}'.format(Constants.BITBUCKET_API_URL,
-                                                                                 Constants.ATLASSIAN_ORG_NAME,
-                                                                                 repo_app_name, prs_query))
-                env_prs[env] = prs
-
-                tag_prefix = services_data.env_tag_prefix[env]
-                tags_query = 'name~"{}"&sort=-target.date'.format(tag_prefix)
-                tags = __get_tags('{}/repositories/{}/{}/refs/tags?q={}'.format(Constants.BITBUCKET_API_URL,
-                                                                                Constants.ATLASSIAN_ORG_NAME,
-                                                                                repo_app_name, tags_query))
-
-                tags_for_commits[app_name] = {}
-                for tag in tags['values']:
-                    commit_id = tag['target']['hash'][:12]
-                    if commit_id not in tags_for_commits[app_name]:
-                        tags_for_commits[app_name][commit_id] = tag['name']
-                    else:
-                        tags_for_commits[app_name][commit_id] += ',{}'.format(tag['name'])
-
-                pull_requests = env_prs[env]
-
-                elements_number = min(pull_requests['pagelen'], pull_requests['size'])
-
-                for v in pull_requests['values'][:elements_number]:
-                    hash = v['merge_commit']['hash']
-                    title = v['title']
-                    author = v['author']['display_name']
-                    version = ''
-                    pr_link = v['links']['html']['href']
+    with metrics.stage('service_versions', 'linking'):
+        __link_pull_requests(app_names, env_names, env_reports, queries, results)
 
-                    if hash in tags_for_commits[app_name]:
-                        version = tags_for_commits[app_name][hash]
+    return VersionsReport(generated_at=datetime.utcnow().isoformat(),
+                          app_names=app_names,
+                          envs=env_reports,
+                          build_time=time.monotonic() - started)
 
-                    logger.info(f"""ENV: {env}, APP: {app_name}
-                        HASH:      {hash}
-                        COMMIT_ID: {env_app_data[env][app_name]['commitId']}
-                        FOUND: {env_app_data[env][app_name]['found']}
-                    """)
-                    colour = 'lightgray'
 
-                    if env_app_data[env][app_name] and hash == env_app_data[env][app_name]['commitId']:
-                        env_app_data[env][app_name]['found'] = True
-                    if env_app_data[env][app_name]['found']:
-                        colour = 'green'
+def __link_pull_requests(app_names, env_names, env_reports, queries, results):
+    for app_name in app_names:
+        for env in env_names:
+            cell = env_reports[env].cells[app_name]
+            if cell.deployment is None:
+                continue
+
+            try:
+                prs_query, tags_query, graph_query = queries[(app_name, env)]
+                pull_requests = __query_result(results, prs_query)
+                tags = __query_result(results, tags_query)
+
+                is_deployed = __reachability(results, graph_query, cell.deployment.commit_id)
+                if is_deployed is not None:
+                    # ancestry holds for reordered merges and PRs on any page, no need to walk back
+                    cell.deployment.found = True
+                    for v in islice(pull_requests, Constants.PR_ROWS):
+                        cell.pull_requests.append(__pull_request(v, tags, is_deployed(v['merge_commit']['hash'][:12])))
+                    continue
+
+                # walk further back through the merged PRs only until the deployed commit is found
+                searchable = cell.deployment.commit_id != 'unknown'
+                for position, v in enumerate(pull_requests):
+                    if position >= Constants.PR_ROWS and (cell.deployment.found or not searchable):
+                        break
 
-                    prs_data[app_name][env].append({'title': title, 'hash': hash, 'colour': colour, 'author': author,
-                                                    'version': version, 'pr_link': pr_link})
+                    hash = v['merge_commit']['hash']
+                    if hash == cell.deployment.commit_id:
+                        cell.deployment.found = True
+                    if position >= Constants.PR_ROWS:
+                        continue
+
+                    logger.debug("ENV: %s, APP: %s HASH: %s COMMIT_ID: %s FOUND: %s",
+                                 env, app_name, hash, cell.deployment.commit_id, cell.deployment.found)
+
+                    cell.pull_requests.append(__pull_request(v, tags, cell.deployment.found))
 
             except Exception as err:
-                logger.exception("Unexpected error:", sys.exc_info())
-                prs_data[app_name][env].append({'title': 'unknown', 'hash': 'unknown', 'colour': 'red', 'author': 'unknown',
-                                                'version': '', 'pr_link': 'unknown'})
-
-    base_versions_for_envs = __get_base_versions_for_releases(services_data)
-
-    with open(file, 'w+') as out:
-        out.write('<html><body>')
-        out.write('Generated at: {} (UTC)'.format(datetime.utcnow().isoformat()))
-        for env in services_data.envs:
-            apps_number = len(app_names)
-            if env in services_data.release_envs:
-                highest_version = sort_versions(env_versions_deployed[env])[0]
-                out.write('<h3>{} latest global version:[{}]</h3>'.format(env, highest_version))
-                out.write('<table>')
-                out.write(('<tr>' + ('<th>{}</th>' * apps_number) + '</tr>').format(*app_names))
-
-                first_row_values = []
-                for app_name in app_names:
-                    if app_name in env_app_data[env]:
-                        first_row_values.append(env_app_data[env][app_name]['build'])
-                        first_row_values.append(env_app_data[env][app_name]['commitTime'])
-                        first_row_values.append(base_versions_for_envs[env][app_name])
-                    else:
-                        first_row_values.append('not available')
-                        first_row_values.append('?')
-                        first_row_values.append('?')
-
-                row = ('<tr>'+('<td>Current version:{}, created:{}, base: {}</td>' * apps_number) + '</tr>').format(*first_row_values)
-                out.write(row)
-            else:
-                out.write('<h3>{}</h3>'.format(env))
-                out.write('<table>')
-                out.write(('<tr>' + ('<th>{}</th>' * apps_number) + '</tr>').format(*app_names))
-
-                first_row_values = []
-                for app_name in app_names:
-                    first_row_values.append(env_app_data[env][app_name]['build'])
-                    first_row_values.append(env_app_data[env][app_name]['commitTime'])
-
-                row = ('<tr>'+('<td>Current version:{}, created:{}</td>' * apps_number) + '</tr>').format(*first_row_values)
-                out.write(row)
-
-            for i in range(10):
-                row_values = []
-                for app_name in app_names:
-                    if env in prs_data[app_name] and i < len(prs_data[app_name][env]):
-                        pr_data = prs_data[app_name][env][i]
-
-                        row_values.append(pr_data['colour'])
-                        if env in services_data.release_envs:
-                            td_content = create_td_content_release(pr_data)
-                        else:
-                            td_content = create_td_content(pr_data, env, services_data.services[app_name])
-                        row_values.append(td_content)
-
-                    else:
-                        row_values.append('white')
-                        row_values.append('')
-
-                row = ('<tr>' + ('<td bgcolor="{}">{}</td>' * apps_number) + '</tr>').format(*row_values)
-
-                out.write(row)
-            out.write('</table>')
-        out.write('</body></html>')
+                logger.exception("Unexpected error: ENV: %s, APP: %s", env, app_name)
+                cell.error = 'pull requests unavailable: {}'.format(err)
+
+
+def __pr_rows(report):
+    return {env: min(Constants.PR_ROWS, max((max(len(cell.pull_requests), 1 if cell.error else 0)
+                                             for cell in env_report.cells.values()), default=0))
+            for env, env_report in report.envs.items()}
+
+
+def __td_content(report, services_data):
+    def td_content(pr, env, app_name):
+        # an app removed from the registry stays in the report until the next build, without build links
+        service = services_data.services.get(app_name)
+        if report.envs[env].release or service is None or env not in service.env_configs:
+            return create_td_content_release(pr)
+        return create_td_content(pr, env, service)
+
+    return td_content
+
+
+def render_report(report, services_data):
+    return render('service_versions.html', report.build_time, report=report, pr_rows=__pr_rows(report),
+                  td_content=__td_content(report, services_data))
+
+
+def render_changed_cells(previous, report, services_data):
+    # None when the table itself changed shape and has to be loaded again
+    if previous is None or previous.app_names != report.app_names or list(previous.envs) != list(report.envs):
+        return None
+    pr_rows = __pr_rows(report)
+    if pr_rows != __pr_rows(previous):
+        return None
+
+    cells = template_module('service_versions_cells.html')
+    td_content = __td_content(report, services_data)
+    changes = {}
+    for env, env_report in report.envs.items():
+        previous_cells = previous.envs[env].cells
+        changed = False
+        for app_name in report.app_names:
+            cell, previous_cell = env_report.cells[app_name], previous_cells[app_name]
+            # partial refreshes keep the cells they did not touch, so most are the very same object
+            if cell is previous_cell or cell.to_dict() == previous_cell.to_dict():
+                continue
+            changed = True
+            changes['{}/{}/version'.format(env, app_name)] = str(cells.version_cell(env_report, app_name)).strip()
+            for i in range(pr_rows[env]):
+                changes['{}/{}/pr-{}'.format(env, app_name, i)] = str(
+                    cells.pr_cell(env_report, app_name, i, td_content)).strip()
+        if changed:
+            changes['{}/heading'.format(env)] = str(cells.env_heading(env_report)).strip()
+    return changes
@@ -0,0 +1,50 @@
+#!/usr/env python3
+
+import logging
+import os
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from . import metrics
+from .config import Constants
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+__environment = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), 'templates')),
+    bytecode_cache=FileSystemBytecodeCache(),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False,
+)
+
+
+def template_module(template_name):
+    return __environment.get_template(template_name).module
+
+
+def render(template_name, build_time, **context):
+    render_time = 0
+    started = time.monotonic()
+    stream = __environment.get_template(template_name).stream(**context)
+    stream.enable_buffering(Constants.RENDER_BUFFER_SIZE)
+    render_time += time.monotonic() - started
+
+    chunks = iter(stream)
+    while True:
+        started = time.monotonic()
+        chunk = next(chunks, None)
+        render_time += time.monotonic() - started
+        if chunk is None:
+            break
+        yield chunk
+
+    total_time = build_time + render_time
+    metrics.REPORT_STAGE_SECONDS.labels(template_name.rsplit('.', 1)[0], 'render').observe(render_time)
+    logger.info("%s rendered in %.3fs of %.3fs total", template_name, render_time, total_time)
+    if render_time > max(Constants.RENDER_TIME_BUDGET * total_time, Constants.RENDER_TIME_MIN_WARNING):
+        logger.warning("%s rendering took %.0f%% of the report time, over the %.0f%% budget",
+                       template_name, 100 * render_time / total_time, 100 * Constants.RENDER_TIME_BUDGET)
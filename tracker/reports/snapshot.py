@@ -0,0 +1,133 @@
+#!/usr/env python3
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+from . import metrics
+from .config import Constants
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+class SnapshotUnavailable(Exception):
+    pass
+
+
+class ReportSnapshot:
+    def __init__(self, name, builder, refresh_interval=Constants.SNAPSHOT_REFRESH_INTERVAL):
+        self.name = name
+        self.builder = builder
+        self.refresh_interval = refresh_interval
+        self.content = None
+        self.built_at = None
+        self.error = None
+        self._derived = {}
+        self._built_monotonic = None
+        self._condition = threading.Condition()
+        self._building = False
+        self._updates_during_build = []
+        self._generation = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def age(self):
+        if self._built_monotonic is None:
+            return None
+        return time.monotonic() - self._built_monotonic
+
+    def get(self):
+        if self.content is None:
+            self.rebuild()
+        if self.content is None:
+            raise SnapshotUnavailable('{} report is not available: {}'.format(self.name, self.error))
+        return self.content
+
+    def derived(self, name, fn):
+        self.get()
+        with self._condition:
+            content, derived = self.content, self._derived
+        if name not in derived:
+            derived[name] = fn(content)
+        return derived[name]
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, previous, content):
+        for listener in self._listeners:
+            try:
+                listener(previous, content)
+            except Exception:
+                logger.exception("Notifying about the %s report failed", self.name)
+
+    def rebuild(self):
+        with self._condition:
+            if self._building:
+                generation = self._generation
+                while self._generation == generation:
+                    self._condition.wait()
+                return
+            self._building = True
+            self._updates_during_build = []
+
+        content, error = None, None
+        started = time.monotonic()
+        try:
+            content = self.builder()
+        except Exception as err:
+            logger.exception("Building %s report failed", self.name)
+            error = err
+
+        previous = None
+        with self._condition:
+            if error is None:
+                # a build may have started before a partial update it would otherwise overwrite
+                for updater in self._updates_during_build:
+                    content = updater(content)
+                previous = self.content
+                self.content = content
+                self._derived = {}
+                self.built_at = datetime.utcnow()
+                self._built_monotonic = time.monotonic()
+            self.error = error
+            metrics.REPORT_BUILDS.labels(self.name, 'success' if error is None else 'failure').inc()
+            self._building = False
+            self._generation += 1
+            self._condition.notify_all()
+
+        logger.info("%s report built in %.3fs", self.name, time.monotonic() - started)
+        if error is None:
+            self._notify(previous, content)
+
+    def update(self, updater):
+        self.get()
+        with self._condition:
+            previous = self.content
+            self.content = content = updater(previous)
+            self._derived = {}
+            if self._building:
+                self._updates_during_build.append(updater)
+        self._notify(previous, content)
+
+    def request_refresh(self):
+        if self._thread is None:
+            threading.Thread(target=self.rebuild, daemon=True).start()
+        else:
+            self._wakeup.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.__run, name=f"{self.name}-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def __run(self):
+        while True:
+            self._wakeup.clear()
+            self.rebuild()
+            self._wakeup.wait(self.refresh_interval)
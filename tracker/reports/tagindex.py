@@ -0,0 +1,85 @@
+#!/usr/env python3
+
+import logging
+import sys
+import threading
+import time
+
+from . import bitbucket
+from .config import Constants
+from .versions import sort_versions
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(format=Constants.LOG_FORMAT)
+logger.setLevel(Constants.LOG_LEVEL)
+
+
+class TagIndex:
+    __slots__ = ('repo_name', 'tag_prefix', 'commits', 'names', 'rebuilt_at', 'lock')
+
+    def __init__(self, repo_name: str, tag_prefix: str):
+        self.repo_name = repo_name
+        self.tag_prefix = tag_prefix
+        self.commits = {}
+        self.names = set()
+        self.rebuilt_at = None
+        self.lock = threading.Lock()
+
+    def url(self):
+        query = 'name~"{}"&sort=-target.date&pagelen={}'.format(self.tag_prefix, Constants.TAG_PAGELEN)
+        return '{}/repositories/{}/{}/refs/tags?q={}'.format(Constants.BITBUCKET_API_URL,
+                                                             Constants.ATLASSIAN_ORG_NAME, self.repo_name, query)
+
+    def __rebuild(self):
+        # built aside and swapped in, lookups never see a half-built index
+        commits, names = {}, set()
+        for tag in bitbucket.iter_values(self.url(), max_pages=Constants.TAG_MAX_PAGES):
+            self.__index(commits, names, tag['target']['hash'], tag['name'])
+        self.commits, self.names = commits, names
+        self.rebuilt_at = time.monotonic()
+        logger.info("%s/%s: indexed %d tags", self.repo_name, self.tag_prefix, len(self.names))
+
+    def refresh(self, revalidate=False):
+        with self.lock:
+            if self.rebuilt_at is None or time.monotonic() - self.rebuilt_at > Constants.TAG_REBUILD_INTERVAL:
+                self.__rebuild()
+                return
+
+            # tags are sorted by the date of the tagged commit, not of the tag, so a new tag on an older commit
+            # can sit below known ones; whole pages are read until one has nothing new
+            new_tags = 0
+            for page in bitbucket.iter_pages(self.url(), max_pages=Constants.TAG_MAX_PAGES, revalidate=revalidate):
+                new_on_page = [tag for tag in page.get('values', []) if tag['name'] not in self.names]
+                for tag in new_on_page:
+                    self.add(tag['target']['hash'], tag['name'])
+                new_tags += len(new_on_page)
+                if not new_on_page:
+                    break
+
+            if new_tags:
+                logger.info("%s/%s: indexed %d new tags", self.repo_name, self.tag_prefix, new_tags)
+
+    @staticmethod
+    def __index(commits, names, commit_hash, name):
+        commit_id = sys.intern(commit_hash[:12])
+        name = sys.intern(name)
+        names.add(name)
+        commits[commit_id] = tuple(sort_versions(commits.get(commit_id, ()) + (name,)))
+
+    def add(self, commit_hash, name):
+        self.__index(self.commits, self.names, commit_hash, name)
+
+    def get(self, commit_hash):
+        return self.commits.get(commit_hash[:12], ())
+
+
+__indexes = {}
+__indexes_lock = threading.Lock()
+
+
+def tag_index(repo_name, tag_prefix):
+    key = (repo_name, tag_prefix)
+    with __indexes_lock:
+        if key not in __indexes:
+            __indexes[key] = TagIndex(repo_name, tag_prefix)
+        return __indexes[key]
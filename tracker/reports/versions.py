@@ -0,0 +1,40 @@
+#!/usr/env python3
+
+import heapq
+import re
+from functools import lru_cache
+
+from . import metrics
+from .config import Constants
+
+__version_regex = re.compile(r'^(?:{}|{})?(\d+)\.(\d+)\.(\d+)'.format(re.escape(Constants.RELEASE_TAG_PREFIX),
+                                                                     re.escape(Constants.DEV_TAG_PREFIX)))
+__malformed = (-1,)
+
+
+@lru_cache(maxsize=Constants.VERSION_CACHE_SIZE)
+def parse_version(tag):
+    match = __version_regex.match(tag.replace('.t', ''))
+    if match is None:
+        return None
+    return tuple(int(number) for number in match.groups())
+
+
+metrics.register_lru_cache('parse_version', parse_version)
+
+
+def version_key(tag):
+    parsed = parse_version(tag)
+    return __malformed if parsed is None else parsed
+
+
+def sort_versions(versions):
+    return sorted(versions, key=version_key, reverse=True)
+
+
+def max_version(versions):
+    return max(versions, key=version_key, default=None)
+
+
+def top_versions(versions, k):
+    return heapq.nlargest(k, versions, key=version_key)
@@ -0,0 +1,42 @@
+(function () {
+    if (!window.EventSource) {
+        return;
+    }
+    var opened = false;
+
+    function connect() {
+        var source = new EventSource('/service-versions/events');
+
+        source.addEventListener('open', function () {
+            // events may have been missed while disconnected
+            if (opened) {
+                window.location.reload();
+            }
+            opened = true;
+        });
+
+        source.addEventListener('error', function () {
+            // the browser gives up when the server turns the stream down, e.g. with too many viewers
+            if (source.readyState === EventSource.CLOSED) {
+                window.setTimeout(connect, 30000);
+            }
+        });
+
+        source.addEventListener('cells', function (event) {
+            var data = JSON.parse(event.data);
+            Object.keys(data.cells).forEach(function (id) {
+                var element = document.getElementById(id);
+                if (element) {
+                    element.outerHTML = data.cells[id];
+                }
+            });
+            document.getElementById('generated-at').textContent = data.generatedAt;
+        });
+
+        source.addEventListener('reload', function () {
+            window.location.reload();
+        });
+    }
+
+    connect();
+})();